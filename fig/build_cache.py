@@ -0,0 +1,94 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from threading import Lock
+import errno
+import hashlib
+import json
+import logging
+import os
+
+from .build_context import context_hash
+
+log = logging.getLogger(__name__)
+
+
+# The directory, relative to the project directory, the cache is kept in.
+CACHE_DIR = '.fig'
+CACHE_FILE = 'build-cache.json'
+
+
+class BuildCache(object):
+    """
+    Remembers the image each service was last built into, keyed on a hash of
+    its build context (honouring `.dockerignore`) and build options, so that
+    a build can be skipped if nothing that goes into it has changed.
+
+    The cache is kept in a JSON file under the project directory.
+    """
+    def __init__(self, project_dir):
+        self.project_dir = os.path.abspath(project_dir)
+        self.path = os.path.join(self.project_dir, CACHE_DIR, CACHE_FILE)
+        self.lock = Lock()
+
+    def key(self, build_path, options):
+        """
+        Return the cache key for building `build_path` with `options`, or
+        None if it isn't a local directory.
+        """
+        if not os.path.isdir(build_path):
+            return None
+        digest = hashlib.sha256()
+        digest.update(context_hash(build_path, exclude=self.exclude(build_path)).encode('utf-8'))
+        digest.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def exclude(self, build_path):
+        """
+        Return the paths to leave out of the build directory at
+        `build_path`: the cache's own directory, if it is inside it.
+        """
+        build_path = os.path.abspath(build_path)
+        cache_dir = os.path.join(self.project_dir, CACHE_DIR)
+        if not cache_dir.startswith(build_path + os.sep):
+            return []
+        return [os.path.relpath(cache_dir, build_path).replace(os.sep, '/')]
+
+    def get(self, tag, key):
+        """Return the ID of the image `tag` was built into for `key`, if any."""
+        if key is None:
+            return None
+        with self.lock:
+            entry = self._load().get(tag)
+        if entry and entry.get('key') == key:
+            return entry.get('image_id')
+        return None
+
+    def set(self, tag, key, image_id):
+        if key is None:
+            return
+        with self.lock:
+            entries = self._load()
+            entries[tag] = {'key': key, 'image_id': image_id}
+            try:
+                self._save(entries)
+            except (IOError, OSError) as e:
+                log.debug("Couldn't write the build cache to %s: %s" % (self.path, e))
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _save(self, entries):
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.rename(temporary_path, self.path)
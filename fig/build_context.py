@@ -0,0 +1,239 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import fnmatch
+import hashlib
+import io
+import logging
+import os
+import sys
+import tarfile
+import zlib
+
+import six
+
+log = logging.getLogger(__name__)
+
+
+def native_path(path):
+    """
+    Return `path` as the type that `os.listdir` gives exact names for:
+    bytes on Python 2 and text on Python 3.
+    """
+    if six.PY2 and isinstance(path, six.text_type):
+        try:
+            return path.encode(sys.getfilesystemencoding() or 'utf-8')
+        except UnicodeEncodeError:
+            return path.encode('utf-8')
+    if six.PY3 and isinstance(path, bytes):
+        return os.fsdecode(path)
+    return path
+
+
+def decode_name(name):
+    """Return a file name listed by `os.listdir` as text."""
+    if isinstance(name, six.text_type):
+        return name
+    for encoding in (sys.getfilesystemencoding(), 'utf-8'):
+        try:
+            return name.decode(encoding or 'utf-8')
+        except (UnicodeDecodeError, LookupError):
+            pass
+    return name.decode('latin-1')
+
+
+def read_dockerignore(path):
+    """
+    Return the patterns in the `.dockerignore` file of the build directory at
+    `path`, or an empty list if it has none.
+    """
+    filename = os.path.join(native_path(path), native_path('.dockerignore'))
+    if not os.path.isfile(filename):
+        return []
+    with io.open(filename, encoding='utf-8') as f:
+        return [line.strip().rstrip('/') for line in f
+                if line.strip() and not line.strip().startswith('#')]
+
+
+def is_excluded(relative_path, patterns):
+    """
+    Return True if `relative_path`, or any directory it is in, matches one of
+    the `.dockerignore` patterns.
+    """
+    if relative_path in ('Dockerfile', '.dockerignore'):
+        return False
+    parts = relative_path.split('/')
+    for i in range(1, len(parts) + 1):
+        prefix = '/'.join(parts[:i])
+        for pattern in patterns:
+            if fnmatch.fnmatch(prefix, pattern):
+                return True
+    return False
+
+
+def is_included(relative_path, include):
+    """
+    Return True if `relative_path` is one of the paths in `include`, is
+    inside one of them, or is a directory one of them is inside.
+    """
+    for path in include:
+        if (relative_path == path
+                or relative_path.startswith(path + '/')
+                or path.startswith(relative_path + '/')):
+            return True
+    return False
+
+
+def walk_context(path, exclude=None, include=None):
+    """
+    Yield the relative path of each file, symlink and directory in the build
+    directory at `path`, in a stable order, leaving out those matched by its
+    `.dockerignore` or by `exclude`. Paths are text, with '/' as a separator.
+
+    If `include` is given, only those paths (and what's in them) are
+    yielded, along with the directories they're in.
+    """
+    for relative_path, _ in iter_context(path, exclude=exclude, include=include):
+        yield relative_path
+
+
+def iter_context(path, exclude=None, include=None):
+    """
+    Like :func:`walk_context`, but yield (relative path, full path) pairs,
+    where the full path is of the type `os` functions take the exact name
+    of the file as.
+    """
+    path = native_path(path)
+    patterns = read_dockerignore(path) + list(exclude or [])
+
+    def walk(directory, relative):
+        for name in sorted(os.listdir(directory)):
+            relative_path = relative + decode_name(name)
+            if is_excluded(relative_path, patterns):
+                continue
+            if include is not None and not is_included(relative_path, include):
+                continue
+            full_path = os.path.join(directory, name)
+            yield relative_path, full_path
+            if os.path.isdir(full_path) and not os.path.islink(full_path):
+                for child in walk(full_path, relative_path + '/'):
+                    yield child
+
+    return walk(path, '')
+
+
+def context_hash(path, exclude=None):
+    """
+    Return a SHA-256 of the names, modes and contents of the files in the
+    build directory at `path`, as they would be sent to the daemon.
+    """
+    digest = hashlib.sha256()
+    for relative_path, full_path in iter_context(path, exclude=exclude):
+        stat = os.lstat(full_path)
+        digest.update(('%s\0%o\0' % (relative_path, stat.st_mode)).encode('utf-8'))
+        if os.path.islink(full_path):
+            digest.update(decode_name(os.readlink(full_path)).encode('utf-8'))
+        elif os.path.isfile(full_path):
+            with open(full_path, 'rb') as f:
+                for block in iter(lambda: f.read(65536), b''):
+                    digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# The size of the chunks a streamed build context is sent in.
+CHUNK_SIZE = 64 * 1024
+
+# The gzip level build contexts are compressed with when they are sent to a
+# daemon that isn't listening on a local socket.
+DEFAULT_COMPRESSION_LEVEL = 6
+
+
+def stream_context(path, exclude=None, include=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield the build directory at `path` as a tar archive, in chunks of at
+    most `chunk_size` bytes, with the files chosen as by
+    :func:`walk_context`.
+
+    Files are read as the archive is consumed, so memory use doesn't grow
+    with the size of the context and the first chunk is ready as soon as the
+    first file has been opened.
+    """
+    # Only used to read files' headers; nothing is written to it.
+    archive = tarfile.TarFile(fileobj=io.BytesIO(), mode='w')
+    for relative_path, full_path in iter_context(path, exclude=exclude, include=include):
+        info = archive.gettarinfo(full_path, relative_path)
+        if info is None:
+            # Sockets can't be archived.
+            continue
+        yield info.tobuf(format=tarfile.GNU_FORMAT, encoding='utf-8')
+        if info.isreg():
+            for chunk in read_padded(full_path, info.size, chunk_size):
+                yield chunk
+            if info.size % tarfile.BLOCKSIZE:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+    yield tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+
+
+def read_padded(filename, size, chunk_size):
+    """
+    Yield exactly `size` bytes of the file at `filename`, in chunks, padding
+    with NULs if it has shrunk since its size was read.
+    """
+    remaining = size
+    with open(filename, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    while remaining > 0:
+        padding = min(chunk_size, remaining)
+        remaining -= padding
+        yield tarfile.NUL * padding
+
+
+def compression_level(base_url, level=None):
+    """
+    Return the gzip level to compress a build context sent to the daemon at
+    `base_url` with, or 0 not to compress it: `level` if it is given, else
+    the level set by FIG_BUILD_COMPRESSION, else DEFAULT_COMPRESSION_LEVEL
+    for a remote daemon and 0 for one on a local socket.
+    """
+    if level is not None:
+        return level
+    value = os.environ.get('FIG_BUILD_COMPRESSION')
+    if value:
+        try:
+            return parse_compression_level(value)
+        except ValueError:
+            log.warning("FIG_BUILD_COMPRESSION should be a number from 0 to 9, not %r. Ignoring it." % value)
+    if is_local_daemon(base_url):
+        return 0
+    return DEFAULT_COMPRESSION_LEVEL
+
+
+def parse_compression_level(value):
+    level = int(value)
+    if not 0 <= level <= 9:
+        raise ValueError(value)
+    return level
+
+
+def is_local_daemon(base_url):
+    """Return True if `base_url` is a docker client's URL for a daemon on a
+    local unix socket.
+    """
+    return not base_url or base_url.startswith(('http+unix:', 'unix:'))
+
+
+def compress_stream(chunks, level):
+    """
+    Yield the gzip compression, at `level`, of the byte strings in `chunks`.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
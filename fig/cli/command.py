@@ -1,3 +1,4 @@
+from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 from requests.exceptions import ConnectionError, SSLError
@@ -5,11 +6,16 @@ import errno
 import logging
 import os
 import re
+import sys
 import yaml
 import six
 
+from ..build_cache import BuildCache
+from ..dry_run import DryRunClient
+from ..progress_stream import PROGRESS_MODES, ProgressLog
 from ..project import Project
 from ..service import ConfigError
+from ..snapshot import ContainerSnapshot
 from .docopt_command import DocoptCommand
 from .utils import call_silently, is_mac, is_ubuntu
 from .docker_client import docker_client
@@ -48,13 +54,19 @@ class Command(DocoptCommand):
             return
 
         explicit_config_path = options.get('--file') or os.environ.get('FIG_FILE')
+        dry_run = command_options.get('--dry-run', False)
         project = self.get_project(
             self.get_config_path(explicit_config_path),
             project_name=options.get('--project-name'),
-            verbose=options.get('--verbose'))
+            verbose=options.get('--verbose'),
+            dry_run=dry_run,
+            progress=options.get('--progress'))
 
         handler(project, command_options)
 
+        if dry_run:
+            print(project.client.format_plan())
+
     def get_client(self, verbose=False):
         client = docker_client()
         if verbose:
@@ -75,15 +87,40 @@ class Command(DocoptCommand):
                 raise errors.FigFileNotFound(os.path.basename(e.filename))
             raise errors.UserError(six.text_type(e))
 
-    def get_project(self, config_path, project_name=None, verbose=False):
+    def get_project(self, config_path, project_name=None, verbose=False, dry_run=False, progress=None):
+        client = self.get_client(verbose=verbose)
+        if dry_run:
+            client = DryRunClient(client)
+
+        # The snapshot lives as long as this command, and is shared by the
+        # project and all of its services.
+        client = ContainerSnapshot(client)
+
+        # A dry run mustn't remember images it only pretended to build.
+        build_cache = None
+        if not dry_run:
+            build_cache = BuildCache(os.path.dirname(os.path.abspath(config_path)))
+
+        progress_log = None
+        if self.get_progress_mode(progress) == 'json':
+            progress_log = ProgressLog(sys.stdout)
+
         try:
             return Project.from_config(
                 self.get_project_name(config_path, project_name),
                 self.get_config(config_path),
-                self.get_client(verbose=verbose))
+                client,
+                build_cache=build_cache,
+                progress_log=progress_log)
         except ConfigError as e:
             raise errors.UserError(six.text_type(e))
 
+    def get_progress_mode(self, progress=None):
+        progress = progress or os.environ.get('FIG_PROGRESS') or 'tty'
+        if progress not in PROGRESS_MODES:
+            raise errors.UserError('Progress should be shown as "%s", not "%s".' % ('" or "'.join(PROGRESS_MODES), progress))
+        return progress
+
     def get_project_name(self, config_path, project_name=None):
         def normalize_name(name):
             return re.sub(r'[^a-zA-Z0-9]', '', name)
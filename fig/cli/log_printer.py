@@ -3,6 +3,7 @@ from __future__ import absolute_import
 import sys
 
 from itertools import cycle
+from threading import Lock
 
 from .multiplexer import Multiplexer, STOP
 from . import colors
@@ -10,15 +11,21 @@ from .utils import split_buffer
 
 
 class LogPrinter(object):
-    def __init__(self, containers, attach_params=None, output=sys.stdout, monochrome=False):
+    def __init__(self, containers, attach_params=None, output=sys.stdout, monochrome=False, monitor=None):
         self.containers = containers
         self.attach_params = attach_params or {}
+        self.monitor = monitor
+        self.color_fns = {}
+        self.reported = set()
+        self.lock = Lock()
         self.prefix_width = self._calculate_prefix_width(containers)
         self.generators = self._make_log_generators(monochrome)
         self.output = output
 
     def run(self):
         mux = Multiplexer(self.generators)
+        if self.monitor:
+            self.monitor.subscribe(lambda name, state: self._container_changed(mux, name, state))
         for line in mux.loop():
             self.output.write(line)
 
@@ -44,6 +51,7 @@ class LogPrinter(object):
                 color_fn = lambda s: s
             else:
                 color_fn = color_fns.next()
+            self.color_fns[container.name] = color_fn
             generators.append(self._make_log_generator(container, color_fn))
 
         return generators
@@ -56,10 +64,37 @@ class LogPrinter(object):
         for line in line_generator:
             yield prefix + line
 
-        exit_code = container.wait()
-        yield color_fn("%s exited with code %s\n" % (container.name, exit_code))
+        if self.monitor:
+            # The attach stream has ended, so the container has stopped and
+            # its die event has arrived or should follow shortly.
+            exit_code = self.monitor.wait(container, timeout=1)
+        else:
+            exit_code = container.wait()
+        if self._mark_reported(container.name):
+            yield self._exit_message(container.name, exit_code)
         yield STOP
 
+    def _container_changed(self, mux, name, state):
+        """
+        Report an attached container's exit as soon as the monitor sees it
+        die, rather than once its attach stream has been read to the end.
+        """
+        if state.running or name not in self.color_fns:
+            return
+        if self._mark_reported(name):
+            mux.queue.put(self._exit_message(name, state.exit_code))
+
+    def _mark_reported(self, name):
+        """Return True the first time it's called for `name`."""
+        with self.lock:
+            if name in self.reported:
+                return False
+            self.reported.add(name)
+            return True
+
+    def _exit_message(self, name, exit_code):
+        return self.color_fns[name]("%s exited with code %s\n" % (name, exit_code))
+
     def _generate_prefix(self, container):
         """
         Generate the prefix for a log line without colour
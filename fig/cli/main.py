@@ -10,6 +10,10 @@ from inspect import getdoc
 import dockerpty
 
 from .. import __version__
+from ..build_context import parse_compression_level
+from ..container import inspect_containers
+from ..events import ContainerMonitor
+from ..progress_stream import StreamOutputError
 from ..project import NoSuchService, ConfigurationError
 from ..service import BuildError, CannotBeScaledError
 from .command import Command
@@ -46,6 +50,9 @@ def main():
     except BuildError as e:
         log.error("Service '%s' failed to build: %s" % (e.service.name, e.reason))
         sys.exit(1)
+    except StreamOutputError as e:
+        log.error(e)
+        sys.exit(1)
 
 
 def setup_logging():
@@ -79,6 +86,8 @@ class TopLevelCommand(Command):
       --version                 Print version and exit
       -f, --file FILE           Specify an alternate fig file (default: fig.yml)
       -p, --project-name NAME   Specify an alternate project name (default: directory name)
+      --progress MODE           Show build and pull progress as "tty" or as "json",
+                                a line of JSON per event (default: $FIG_PROGRESS, or tty)
 
     Commands:
       build     Build or rebuild services
@@ -113,10 +122,23 @@ class TopLevelCommand(Command):
         Usage: build [options] [SERVICE...]
 
         Options:
-            --no-cache  Do not use cache when building the image.
+            --no-cache         Do not use cache when building the image.
+            --parallel N       Build at most N services at once (default:
+                               $FIG_PARALLEL, or 10).
+            --compress LEVEL   Gzip build contexts at LEVEL, from 0 (off) to 9
+                               (default: $FIG_BUILD_COMPRESSION, or 6 if the
+                               daemon is remote).
+            --minimal-context  Only send the files each Dockerfile adds or
+                               copies, where they can be worked out.
         """
         no_cache = bool(options.get('--no-cache', False))
-        project.build(service_names=options['SERVICE'], no_cache=no_cache)
+        project.build(
+            service_names=options['SERVICE'],
+            no_cache=no_cache,
+            parallel=get_parallel_limit(options),
+            compress_level=get_compress_level(options),
+            minimal_context=bool(options.get('--minimal-context', False)),
+        )
 
     def help(self, project, options):
         """
@@ -196,6 +218,7 @@ class TopLevelCommand(Command):
             for container in containers:
                 print(container.id)
         else:
+            inspect_containers(containers, keys=['Command', 'Status', 'Ports'])
             headers = [
                 'Name',
                 'Command',
@@ -224,11 +247,14 @@ class TopLevelCommand(Command):
         Options:
             --allow-insecure-ssl    Allow insecure connections to the docker
                                     registry
+            --parallel N            Pull at most N images at once (default:
+                                    $FIG_PARALLEL, or 10).
         """
         insecure_registry = options['--allow-insecure-ssl']
         project.pull(
             service_names=options['SERVICE'],
-            insecure_registry=insecure_registry
+            insecure_registry=insecure_registry,
+            parallel=get_parallel_limit(options),
         )
 
     def rm(self, project, options):
@@ -238,15 +264,17 @@ class TopLevelCommand(Command):
         Usage: rm [options] [SERVICE...]
 
         Options:
-            --force   Don't ask to confirm removal
-            -v        Remove volumes associated with containers
+            --force     Don't ask to confirm removal
+            -v          Remove volumes associated with containers
+            --dry-run   Print what would be removed, without removing anything
         """
         all_containers = project.containers(service_names=options['SERVICE'], stopped=True)
+        inspect_containers(all_containers, keys=['Status'])
         stopped_containers = [c for c in all_containers if not c.is_running]
 
         if len(stopped_containers) > 0:
             print("Going to remove", list_containers(stopped_containers))
-            if options.get('--force') \
+            if options.get('--force') or options.get('--dry-run') \
                     or yesno("Are you sure? [yN] ", default=False):
                 project.remove_stopped(
                     service_names=options['SERVICE'],
@@ -352,7 +380,10 @@ class TopLevelCommand(Command):
 
             $ fig scale web=2 worker=3
 
-        Usage: scale [SERVICE=NUM...]
+        Usage: scale [options] [SERVICE=NUM...]
+
+        Options:
+            --dry-run   Print the actions scaling would take, without taking them
         """
         for s in options['SERVICE=NUM']:
             if '=' not in s:
@@ -387,7 +418,10 @@ class TopLevelCommand(Command):
 
         They can be started again with `fig start`.
 
-        Usage: stop [SERVICE...]
+        Usage: stop [options] [SERVICE...]
+
+        Options:
+            --dry-run   Print what would be stopped, without stopping anything
         """
         project.stop(service_names=options['SERVICE'])
 
@@ -407,11 +441,12 @@ class TopLevelCommand(Command):
         when it exits, all containers will be stopped. If you run `fig up -d`,
         it'll start the containers in the background and leave them running.
 
-        If there are existing containers for a service, `fig up` will stop
-        and recreate them (preserving mounted volumes with volumes-from),
-        so that changes in `fig.yml` are picked up. If you do not want existing
-        containers to be recreated, `fig up --no-recreate` will re-use existing
-        containers.
+        If there are existing containers for a service whose configuration
+        or image has changed, `fig up` will stop and recreate them (preserving
+        mounted volumes), so that changes in `fig.yml` are picked up. If you
+        want all existing containers to be recreated, use
+        `fig up --force-recreate`. If you do not want existing containers to
+        be recreated, `fig up --no-recreate` will re-use existing containers.
 
         Usage: up [options] [SERVICE...]
 
@@ -423,14 +458,34 @@ class TopLevelCommand(Command):
             --no-color            Produce monochrome output.
             --no-deps             Don't start linked services.
             --no-recreate         If containers already exist, don't recreate them.
+            --force-recreate      Recreate containers even if their configuration
+                                  and image haven't changed.
+            --dry-run             Print the actions `up` would take, without
+                                  taking them. Implies -d.
+            --parallel N          Bring up at most N services at once (default:
+                                  $FIG_PARALLEL, or 10).
+            --max-unavailable N   Recreate containers in rolling batches, with
+                                  at most N of a service's containers down at
+                                  once.
+            --max-surge N         Recreate containers in rolling batches, starting
+                                  up to N new containers before their old ones
+                                  are stopped.
         """
         insecure_registry = options['--allow-insecure-ssl']
-        detached = options['-d']
+        detached = options['-d'] or options.get('--dry-run')
+        parallel = get_parallel_limit(options)
+        max_unavailable = get_count(options, '--max-unavailable')
+        max_surge = get_count(options, '--max-surge')
+        if (max_unavailable is not None or max_surge is not None) and not (max_unavailable or max_surge):
+            raise UserError('One of --max-unavailable and --max-surge must be at least 1.')
 
         monochrome = options['--no-color']
 
         start_links = not options['--no-deps']
         recreate = not options['--no-recreate']
+        force_recreate = options['--force-recreate']
+        if force_recreate and not recreate:
+            raise UserError('--force-recreate and --no-recreate cannot be combined.')
         service_names = options['SERVICE']
 
         project.up(
@@ -438,13 +493,20 @@ class TopLevelCommand(Command):
             start_links=start_links,
             recreate=recreate,
             insecure_registry=insecure_registry,
+            parallel=parallel,
+            max_unavailable=max_unavailable,
+            max_surge=max_surge,
+            force_recreate=force_recreate,
         )
 
         to_attach = [c for s in project.get_services(service_names) for c in s.containers()]
 
         if not detached:
+            monitor = ContainerMonitor(project.client, to_attach, project=project.name)
+            monitor.start()
+
             print("Attaching to", list_containers(to_attach))
-            log_printer = LogPrinter(to_attach, attach_params={"logs": True}, monochrome=monochrome)
+            log_printer = LogPrinter(to_attach, attach_params={"logs": True}, monochrome=monochrome, monitor=monitor)
 
             try:
                 log_printer.run()
@@ -458,5 +520,41 @@ class TopLevelCommand(Command):
                 project.stop(service_names=service_names)
 
 
+def get_parallel_limit(options):
+    value = options.get('--parallel')
+    if value is None:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise UserError('--parallel should be a positive number, not "%s".' % value)
+    return limit
+
+
+def get_compress_level(options):
+    value = options.get('--compress')
+    if value is None:
+        return None
+    try:
+        return parse_compression_level(value)
+    except ValueError:
+        raise UserError('--compress should be a number from 0 to 9, not "%s".' % value)
+
+
+def get_count(options, name):
+    value = options.get(name)
+    if value is None:
+        return None
+    try:
+        count = int(value)
+    except ValueError:
+        count = -1
+    if count < 0:
+        raise UserError('%s should be a number, not "%s".' % (name, value))
+    return count
+
+
 def list_containers(containers):
     return ", ".join(c.name for c in containers)
@@ -1,18 +1,38 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
+import re
 
 import six
 
+from .parallel import parallel_execute
+
+
+RUNNING_STATUSES = ('Up', 'Restarting')
+
+EXITED_STATUS_RE = re.compile(r'^Exit(?:ed)? \(?(-?\d+)')
+
+
+def is_running_status(status):
+    """Return True if `status`, the Status of a GET /containers/json entry,
+    describes a running container.
+    """
+    return (status or '').startswith(RUNNING_STATUSES)
+
 
 class Container(object):
     """
     Represents a Docker container, constructed from the output of
     GET /containers/:id:/json.
+
+    A container constructed from the output of GET /containers/json also
+    keeps that entry as its `ps_view`, which answers questions about the
+    container's command, state and ports without inspecting it.
     """
-    def __init__(self, client, dictionary, has_been_inspected=False):
+    def __init__(self, client, dictionary, has_been_inspected=False, ps_view=None):
         self.client = client
         self.dictionary = dictionary
         self.has_been_inspected = has_been_inspected
+        self.ps_view = ps_view or {}
 
     @classmethod
     def from_ps(cls, client, dictionary, **kwargs):
@@ -26,7 +46,7 @@ class Container(object):
         for name in dictionary.get('Names', []):
             if len(name.split('/')) == 2:
                 new_dictionary['Name'] = name
-        return cls(client, new_dictionary, **kwargs)
+        return cls(client, new_dictionary, ps_view=dictionary, **kwargs)
 
     @classmethod
     def from_id(cls, client, id):
@@ -77,11 +97,24 @@ class Container(object):
             return '{HostIp}:{HostPort}->{private}'.format(
                 private=private, **public[0])
 
+        if self.uses_ps_view('Ports'):
+            ports = ps_ports(self.ps_view['Ports'])
+        else:
+            ports = self.ports
+
         return ', '.join(format_port(*item)
-                         for item in sorted(six.iteritems(self.ports)))
+                         for item in sorted(six.iteritems(ports)))
 
     @property
     def human_readable_state(self):
+        if self.uses_ps_view('Status'):
+            status = self.ps_view['Status']
+            if is_running_status(status):
+                return 'Up'
+            match = EXITED_STATUS_RE.match(status)
+            if match:
+                return 'Exit %s' % match.group(1)
+
         if self.is_running:
             return 'Ghost' if self.get('State.Ghost') else 'Up'
         else:
@@ -89,6 +122,9 @@ class Container(object):
 
     @property
     def human_readable_command(self):
+        if self.uses_ps_view('Command'):
+            return self.ps_view['Command']
+
         entrypoint = self.get('Config.Entrypoint') or []
         cmd = self.get('Config.Cmd') or []
         return ' '.join(entrypoint + cmd)
@@ -99,8 +135,16 @@ class Container(object):
 
     @property
     def is_running(self):
+        if self.uses_ps_view('Status'):
+            return is_running_status(self.ps_view['Status'])
         return self.get('State.Running')
 
+    def uses_ps_view(self, *keys):
+        """Return True if all of `keys` can be read from the ps view, in
+        which case they are read from there rather than by inspecting.
+        """
+        return all(key in self.ps_view for key in keys)
+
     def get(self, key):
         """Return a value from the container or None if the value is not set.
 
@@ -170,3 +214,32 @@ class Container(object):
         if type(self) != type(other):
             return False
         return self.id == other.id
+
+
+def ps_ports(ports):
+    """Convert the Ports of a GET /containers/json entry into the format of
+    NetworkSettings.Ports in GET /containers/:id:/json.
+    """
+    result = {}
+    for port in ports or []:
+        public = result.setdefault('%s/%s' % (port['PrivatePort'], port['Type']), [])
+        if port.get('PublicPort'):
+            public.append({
+                'HostIp': port.get('IP', ''),
+                'HostPort': six.text_type(port['PublicPort']),
+            })
+    return result
+
+
+def inspect_containers(containers, keys=None, limit=None):
+    """
+    Inspect each container in `containers` that hasn't been inspected yet,
+    with up to `limit` requests in flight at once. If `keys` is given,
+    containers that can answer all of them from their ps view are skipped.
+    """
+    parallel_execute(
+        [c for c in containers
+         if not c.has_been_inspected
+         and (keys is None or not c.uses_ps_view(*keys))],
+        lambda c: c.inspect(),
+        limit=limit)
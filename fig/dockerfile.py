@@ -0,0 +1,113 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import fnmatch
+import io
+import json
+import os
+import posixpath
+
+from .build_context import walk_context
+
+
+def parse_dockerfile(path):
+    """
+    Return a list of (instruction, arguments) pairs for the Dockerfile at
+    `path`, with comments skipped and continued lines joined. Instructions
+    are upper-cased.
+
+    The Dockerfile is read as UTF-8; `UnicodeDecodeError` is raised if it
+    isn't.
+    """
+    instructions = []
+    current = ''
+
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.endswith('\\'):
+                current += line[:-1] + ' '
+                continue
+            current += line
+            bits = current.split(None, 1)
+            instructions.append((bits[0].upper(), bits[1].strip() if len(bits) > 1 else ''))
+            current = ''
+
+    return instructions
+
+
+def get_base_image(build_path):
+    """
+    Return the image named by the first `FROM` in the Dockerfile of the
+    build directory at `build_path`, or None if it can't be read.
+    """
+    path = os.path.join(build_path, 'Dockerfile')
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        instructions = parse_dockerfile(path)
+    except (IOError, UnicodeDecodeError):
+        return None
+
+    for instruction, arguments in instructions:
+        if instruction == 'FROM' and arguments:
+            return arguments.split()[0]
+    return None
+
+
+def get_sources(arguments):
+    """
+    Return the source paths of an `ADD` or `COPY` instruction's arguments,
+    in either the JSON or the whitespace-separated form.
+    """
+    arguments = arguments.strip()
+    if arguments.startswith('['):
+        try:
+            paths = json.loads(arguments)
+        except ValueError:
+            paths = None
+        if isinstance(paths, list):
+            return paths[:-1]
+    return arguments.split()[:-1]
+
+
+def get_context_paths(build_path):
+    """
+    Return the paths, relative to the build directory at `build_path`, that
+    its Dockerfile's `ADD` and `COPY` instructions read, plus the Dockerfile
+    itself. Wildcards are matched against the directory's contents.
+
+    Return None if the whole directory is needed, or if the sources can't
+    all be worked out: the Dockerfile can't be read or decoded, a source names the
+    directory itself, lies outside it or uses a variable, or a wildcard
+    matches nothing.
+    """
+    path = os.path.join(build_path, 'Dockerfile')
+    try:
+        instructions = parse_dockerfile(path)
+    except (IOError, UnicodeDecodeError):
+        return None
+
+    paths = ['Dockerfile']
+    for instruction, arguments in instructions:
+        if instruction not in ('ADD', 'COPY'):
+            continue
+        for source in get_sources(arguments):
+            if instruction == 'ADD' and source.startswith(('http://', 'https://')):
+                # Fetched by the daemon, not read from the context.
+                continue
+            if '$' in source:
+                return None
+            source = posixpath.normpath(source.lstrip('/'))
+            if source == '.' or source.startswith('..'):
+                return None
+            if any(c in source for c in '*?['):
+                matches = [p for p in walk_context(build_path) if fnmatch.fnmatch(p, source)]
+                if not matches:
+                    return None
+                paths.extend(matches)
+            else:
+                paths.append(source)
+    return paths
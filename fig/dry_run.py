@@ -0,0 +1,295 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from threading import RLock
+import copy
+import hashlib
+import json
+import re
+
+from docker.errors import APIError
+from requests import Response
+
+from .container import is_running_status
+
+
+IMAGE_ID_RE = re.compile(r'^(sha256:)?[0-9a-f]{12,}$')
+
+
+class DryRunClient(object):
+    """
+    A stand-in for a docker client that models containers and images in
+    memory, so that fig's real code can run against it without changing
+    anything.
+
+    It is seeded from one listing of a real daemon's containers and images,
+    or from the `containers` and `images` given if there's no daemon at all.
+    Read calls are answered from the model; the daemon is only asked to
+    inspect the containers it listed. Every call that would change
+    something is recorded in :attr:`actions` instead of being made, and
+    every call is counted in :attr:`calls`.
+    """
+    def __init__(self, client=None, containers=None, images=None, api_version='1.14'):
+        self.client = client
+        self.lock = RLock()
+        self.calls = {}
+        self.actions = []
+        self.api_version = api_version
+        self._seed_containers = containers
+        self._seed_images = images
+        self._containers = None
+        self._images = None
+        self._next_id = 0
+
+    @property
+    def base_url(self):
+        return getattr(self.client, 'base_url', None)
+
+    def version(self):
+        self._count('version')
+        if self.client is not None:
+            return self.client.version()
+        return {'ApiVersion': self.api_version}
+
+    def containers(self, quiet=False, all=False, trunc=True, filters=None, **kwargs):
+        self._count('containers')
+        name = (filters or {}).get('name')
+        if isinstance(name, list):
+            name = name[0] if name else None
+
+        with self.lock:
+            result = []
+            for model in self._get_containers():
+                entry = model['listing']
+                if not (all or is_running_status(entry.get('Status'))):
+                    continue
+                if name and not any(name in n for n in entry.get('Names') or []):
+                    continue
+                entry = dict(entry)
+                if trunc:
+                    entry['Id'] = entry['Id'][:12]
+                result.append(entry)
+            return result
+
+    def inspect_container(self, container):
+        self._count('inspect_container')
+        with self.lock:
+            model = self._find_container(container)
+            info = model['inspect']
+            if info is None:
+                info = self.client.inspect_container(model['listing']['Id'])
+                model['inspect'] = info
+            info = copy.deepcopy(info)
+            info.setdefault('State', {})['Running'] = is_running_status(model['listing'].get('Status'))
+            return info
+
+    def create_container(self, image, command=None, name=None, environment=None, volumes=None, entrypoint=None, **kwargs):
+        self._count('create_container')
+        with self.lock:
+            image_id = self._find_image(image)
+            if image_id is None:
+                raise not_found('No such image: %s' % image)
+
+            container_id = self._new_id(name or image)
+            self._get_containers().insert(0, {
+                'listing': {
+                    'Id': container_id,
+                    'Names': ['/' + name] if name else [],
+                    'Image': image,
+                    'Command': ' '.join(command) if isinstance(command, list) else (command or ''),
+                    'Status': '',
+                    'Ports': [],
+                },
+                'inspect': {
+                    'Id': container_id,
+                    'Name': '/' + name if name else '',
+                    'Image': image_id,
+                    'Config': {
+                        'Image': image,
+                        'Cmd': command,
+                        'Entrypoint': entrypoint,
+                        'Env': ['%s=%s' % item for item in sorted((environment or {}).items())],
+                    },
+                    'State': {'Running': False, 'ExitCode': 0},
+                    'NetworkSettings': {'Ports': {}},
+                    'Volumes': dict((path, '/dry-run/volumes/%s%s' % (container_id, path)) for path in volumes or {}),
+                    'VolumesRW': dict((path, True) for path in volumes or {}),
+                },
+            })
+            self._record('create', name or container_id[:12], image)
+            return {'Id': container_id, 'Warnings': None}
+
+    def start(self, container, **kwargs):
+        self._count('start')
+        self._set_status(container, 'start', 'Up Less than a second')
+
+    def restart(self, container, timeout=10):
+        self._count('restart')
+        self._set_status(container, 'restart', 'Up Less than a second')
+
+    def stop(self, container, timeout=10):
+        self._count('stop')
+        self._set_status(container, 'stop', 'Exited (0) Less than a second ago')
+
+    def kill(self, container, signal=None):
+        self._count('kill')
+        self._set_status(container, 'kill', 'Exited (-1) Less than a second ago')
+
+    def wait(self, container):
+        self._count('wait')
+        self._set_status(container, 'wait for', 'Exited (0) Less than a second ago')
+        return 0
+
+    def remove_container(self, container, v=False, link=False, force=False):
+        self._count('remove_container')
+        with self.lock:
+            model = self._find_container(container)
+            self._get_containers().remove(model)
+            self._record('remove', container_name(model))
+
+    def images(self, name=None, quiet=False, all=False, **kwargs):
+        self._count('images')
+        with self.lock:
+            result = []
+            for image in self._get_images():
+                tags = image.get('RepoTags') or []
+                if name and not any(tag == name or tag.split(':')[0] == name for tag in tags):
+                    continue
+                result.append(image['Id'] if quiet else dict(image))
+            return result
+
+    def inspect_image(self, image_id):
+        self._count('inspect_image')
+        with self.lock:
+            found = self._find_image(image_id)
+            if found is None:
+                raise not_found('No such image: %s' % image_id)
+            return {'Id': found}
+
+    def build(self, path=None, tag=None, stream=False, **kwargs):
+        self._count('build')
+        with self.lock:
+            image_id = self._new_id(tag or path)
+            self._add_image(image_id, tag)
+            self._record('build', tag or image_id[:12], path)
+        output = [json.dumps({'stream': 'Successfully built %s\n' % image_id[:12]})]
+        return iter(output) if stream else output[0]
+
+    def pull(self, repository, tag=None, stream=False, insecure_registry=False):
+        self._count('pull')
+        name = '%s:%s' % (repository, tag) if tag else repository
+        with self.lock:
+            self._add_image(self._new_id(name), name)
+            self._record('pull', name)
+        output = [json.dumps({'status': 'Pulled %s' % name})]
+        return iter(output) if stream else output[0]
+
+    def tag(self, image, repository, tag=None, force=False):
+        self._count('tag')
+        name = '%s:%s' % (repository, tag) if tag else repository
+        with self.lock:
+            image_id = self._find_image(image)
+            self._add_image(image_id or image, name)
+            self._record('tag', name, image)
+        return True
+
+    def format_plan(self):
+        """Return the recorded actions and call counts, one per line."""
+        lines = []
+        if self.actions:
+            lines.append('Actions:')
+            for verb, subject, detail in self.actions:
+                lines.append('    %s %s%s' % (verb, subject, ' (%s)' % detail if detail else ''))
+        else:
+            lines.append('Nothing to do.')
+        lines.append('API calls: %d (%s)' % (
+            sum(self.calls.values()),
+            ', '.join('%s=%d' % item for item in sorted(self.calls.items()))))
+        return '\n'.join(lines)
+
+    def _count(self, method):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+    def _record(self, verb, subject, detail=None):
+        self.actions.append((verb, subject, detail))
+
+    def _set_status(self, container, verb, status):
+        with self.lock:
+            model = self._find_container(container)
+            model['listing']['Status'] = status
+            self._record(verb, container_name(model))
+
+    def _new_id(self, seed):
+        self._next_id += 1
+        return hashlib.sha256(('%s-%d' % (seed, self._next_id)).encode('utf-8')).hexdigest()
+
+    def _get_containers(self):
+        if self._containers is None:
+            if self._seed_containers is not None:
+                seed = self._seed_containers
+            elif self.client is not None:
+                seed = self.client.containers(all=True, trunc=False)
+            else:
+                seed = []
+            self._containers = [{'listing': dict(c), 'inspect': None} for c in seed]
+            if self.client is None:
+                for model in self._containers:
+                    model['inspect'] = {'Id': model['listing']['Id'], 'Config': {}, 'Volumes': {}}
+        return self._containers
+
+    def _get_images(self):
+        if self._images is None:
+            if self._seed_images is not None:
+                seed = self._seed_images
+            elif self.client is not None:
+                seed = self.client.images()
+            else:
+                seed = []
+            self._images = [dict(image) for image in seed]
+        return self._images
+
+    def _find_container(self, container):
+        if isinstance(container, dict):
+            container = container.get('Id')
+        for model in self._get_containers():
+            entry = model['listing']
+            if entry['Id'].startswith(container) or '/' + container in (entry.get('Names') or []):
+                return model
+        raise not_found('No such container: %s' % container)
+
+    def _find_image(self, name):
+        if ':' not in name.split('/')[-1]:
+            tagged = name + ':latest'
+        else:
+            tagged = name
+        for image in self._get_images():
+            if tagged in (image.get('RepoTags') or []):
+                return image['Id']
+            if IMAGE_ID_RE.match(name) and image['Id'].startswith(name):
+                return image['Id']
+        return None
+
+    def _add_image(self, image_id, name):
+        if name and ':' not in name.split('/')[-1]:
+            name += ':latest'
+        for image in self._get_images():
+            if name in (image.get('RepoTags') or []):
+                image['RepoTags'].remove(name)
+        for image in self._get_images():
+            if image['Id'] == image_id:
+                if name:
+                    image.setdefault('RepoTags', []).append(name)
+                return
+        self._get_images().append({'Id': image_id, 'RepoTags': [name] if name else []})
+
+
+def container_name(model):
+    names = model['listing'].get('Names') or []
+    return names[0].lstrip('/') if names else model['listing']['Id'][:12]
+
+
+def not_found(explanation):
+    response = Response()
+    response.status_code = 404
+    response.reason = 'Not Found'
+    return APIError(explanation, response, explanation)
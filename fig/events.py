@@ -0,0 +1,153 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from collections import namedtuple
+from threading import Event, Lock, Thread
+import logging
+
+from .progress_stream import json_stream
+
+log = logging.getLogger(__name__)
+
+
+ContainerState = namedtuple('ContainerState', 'running exit_code restart_count')
+
+START_EVENTS = ('start', 'restart', 'unpause')
+DIE_EVENTS = ('die',)
+
+
+class ContainerMonitor(object):
+    """
+    Follows the daemon's event stream in a background thread and keeps the
+    state of a project's containers up to date, so that it can be read
+    without asking the daemon.
+
+    Containers are tracked if they were passed in, or if an event names them
+    as belonging to `project`. If the client is a
+    :class:`fig.snapshot.ContainerSnapshot`, its listing is updated too, so
+    that :attr:`fig.container.Container.is_running` stays current.
+    """
+    def __init__(self, client, containers, project=None):
+        self.client = client
+        self.project = project
+        self.names = {}
+        self.states = {}
+        self.exited = {}
+        self.subscribers = []
+        self.lock = Lock()
+        self.following = False
+
+        for container in containers:
+            self.track(container.id, container.name,
+                       ContainerState(bool(container.is_running), None, 0))
+
+    def track(self, container_id, name, state):
+        with self.lock:
+            self.names[container_id] = name
+            self.states[container_id] = state
+            self.exited.setdefault(container_id, Event())
+            if not state.running:
+                self.exited[container_id].set()
+
+    def subscribe(self, callback):
+        """Call `callback(name, state)` from the monitor thread whenever a
+        tracked container starts or dies.
+        """
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def start(self):
+        self.following = True
+        t = Thread(target=self.run)
+        t.daemon = True
+        t.start()
+
+    def run(self):
+        self.following = True
+        try:
+            for event in json_stream(self.client.events()):
+                self.handle_event(event)
+        except Exception as e:
+            log.debug("Stopped following events: %s" % e)
+        finally:
+            self.following = False
+            # Wake anything waiting for a container to die, so that it can
+            # ask the daemon instead.
+            with self.lock:
+                for exited in self.exited.values():
+                    exited.set()
+
+    def handle_event(self, event):
+        status = event.get('status')
+        if status not in START_EVENTS + DIE_EVENTS:
+            return
+
+        container_id = event.get('id')
+        if container_id not in self.names:
+            name = get_event_name(event)
+            if not (name and self.project and name.startswith(self.project + '_')):
+                return
+            self.track(container_id, name, ContainerState(False, None, 0))
+
+        previous = self.states[container_id]
+        if status in START_EVENTS:
+            restart_count = previous.restart_count
+            if previous.exit_code is not None:
+                restart_count += 1
+            state = ContainerState(True, None, restart_count)
+            self.exited[container_id].clear()
+            self._record_status(container_id, 'Up Less than a second')
+        else:
+            exit_code = get_event_exit_code(event)
+            if exit_code is None:
+                exit_code = self.client.inspect_container(container_id)['State']['ExitCode']
+            state = ContainerState(False, exit_code, previous.restart_count)
+            self._record_status(container_id, 'Exited (%s) Less than a second ago' % exit_code)
+
+        with self.lock:
+            self.states[container_id] = state
+        if not state.running:
+            self.exited[container_id].set()
+
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            callback(self.names[container_id], state)
+
+    def state(self, container):
+        """Return the last known :class:`ContainerState` of `container`, or
+        None if it isn't tracked.
+        """
+        return self.states.get(container.id)
+
+    def wait(self, container, timeout=None):
+        """Return the exit code of `container` once it has stopped.
+
+        Blocks until the monitor sees the container die. If the container
+        isn't tracked, the event stream ends, or no event arrives within
+        `timeout` seconds (it may have died before the monitor started),
+        fall back to asking the daemon.
+        """
+        exited = self.exited.get(container.id)
+        if exited is not None and self.following:
+            exited.wait(timeout)
+            if exited.is_set():
+                exit_code = self.states[container.id].exit_code
+                if exit_code is not None:
+                    return exit_code
+        return container.wait()
+
+    def _record_status(self, container_id, status):
+        if hasattr(self.client, 'record_status'):
+            self.client.record_status(container_id, status)
+
+
+def get_event_name(event):
+    """Return the container name carried by newer daemons' events."""
+    name = (event.get('Actor') or {}).get('Attributes', {}).get('name')
+    return name.lstrip('/') if name else None
+
+
+def get_event_exit_code(event):
+    """Return the exit code carried by newer daemons' die events."""
+    exit_code = (event.get('Actor') or {}).get('Attributes', {}).get('exitCode')
+    return int(exit_code) if exit_code is not None else None
@@ -0,0 +1,207 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import logging
+import os
+import sys
+from threading import Thread
+
+import six
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty  # Python 3.x
+
+
+log = logging.getLogger(__name__)
+
+
+# The number of calls made at once when no limit is given, unless the
+# FIG_PARALLEL environment variable says otherwise.
+DEFAULT_LIMIT = 10
+
+
+def default_limit():
+    """Return the limit set by FIG_PARALLEL, or DEFAULT_LIMIT."""
+    value = os.environ.get('FIG_PARALLEL')
+    if not value:
+        return DEFAULT_LIMIT
+    try:
+        return max(1, int(value))
+    except ValueError:
+        log.warning("FIG_PARALLEL should be a number, not %r. Using %d." % (value, DEFAULT_LIMIT))
+        return DEFAULT_LIMIT
+
+
+def parallel_execute(objects, func, limit=None):
+    """
+    Call `func` on each of `objects`, with no more than `limit` calls in
+    progress at once, and return the results in the same order as `objects`.
+
+    Every call is allowed to finish; if any of them raised, the first
+    exception (in the order of `objects`) is then re-raised.
+    """
+    objects = list(objects)
+    limit = max(1, min(limit or default_limit(), len(objects)))
+
+    if len(objects) <= 1 or limit == 1:
+        return [func(obj) for obj in objects]
+
+    pending = Queue()
+    for item in enumerate(objects):
+        pending.put(item)
+
+    done = Queue()
+    for _ in range(limit):
+        t = Thread(target=_worker, args=(func, pending, done))
+        t.daemon = True
+        t.start()
+
+    results = [None] * len(objects)
+    errors = {}
+    remaining = len(objects)
+
+    while remaining:
+        try:
+            i, result, exc_info = done.get(timeout=0.1)
+        except Empty:
+            # Waiting with a timeout keeps the main thread responsive to
+            # Ctrl+C.
+            continue
+        remaining -= 1
+        if exc_info:
+            errors[i] = exc_info
+        else:
+            results[i] = result
+
+    if errors:
+        six.reraise(*errors[min(errors)])
+
+    return results
+
+
+def parallel_execute_graph(objects, func, get_dependencies, limit=None, on_error=None):
+    """
+    Call `func` on each of `objects` as soon as the calls for everything it
+    depends on have finished, with no more than `limit` calls in progress at
+    once, and return the results in the same order as `objects`.
+
+    `get_dependencies(obj)` returns the objects that `obj` depends on; any
+    that aren't in `objects` are ignored.
+
+    If a call raises, nothing that depends on its object, directly or not,
+    is called, but calls already in progress are allowed to finish. The first
+    exception (in the order of `objects`) is then re-raised, after
+    `on_error(obj, exception)` has been called for each of the others.
+    """
+    objects = list(objects)
+    limit = max(1, limit or default_limit())
+
+    waiting = {}
+    for i, obj in enumerate(objects):
+        waiting[i] = set(objects.index(dep) for dep in get_dependencies(obj)
+                         if dep in objects and dep != obj)
+
+    results = [None] * len(objects)
+    errors = {}
+    finished = set()
+    failed = set()
+    done = Queue()
+    running = 0
+
+    while waiting or running:
+        skipped = True
+        while skipped:
+            skipped = False
+            for i in sorted(waiting):
+                if waiting[i] & failed:
+                    log.debug("Skipping %r, as something it depends on failed" % (objects[i],))
+                    del waiting[i]
+                    failed.add(i)
+                    skipped = True
+
+        for i in sorted(waiting):
+            if running >= limit:
+                break
+            if waiting[i] <= finished:
+                del waiting[i]
+                running += 1
+                if limit == 1:
+                    _call(func, i, objects[i], done)
+                else:
+                    t = Thread(target=_call, args=(func, i, objects[i], done))
+                    t.daemon = True
+                    t.start()
+
+        if not running:
+            if waiting:
+                raise ValueError("Circular dependency between %s" % ", ".join(
+                    repr(objects[i]) for i in sorted(waiting)))
+            break
+
+        try:
+            i, result, exc_info = done.get(timeout=0.1)
+        except Empty:
+            # Waiting with a timeout keeps the main thread responsive to
+            # Ctrl+C.
+            continue
+        running -= 1
+        if exc_info:
+            errors[i] = exc_info
+            failed.add(i)
+        else:
+            results[i] = result
+            finished.add(i)
+
+    if errors:
+        first = min(errors)
+        if on_error:
+            for i in sorted(errors):
+                if i != first:
+                    on_error(objects[i], errors[i][1])
+        six.reraise(*errors[first])
+
+    return results
+
+
+def dependency_layers(objects, get_dependencies):
+    """
+    Split `objects` into layers, so that everything an object depends on is
+    in an earlier layer. Objects in the same layer don't depend on each other
+    and keep their order. Dependencies that aren't in `objects` are ignored.
+    """
+    objects = list(objects)
+    depths = {}
+
+    def depth(i, seen):
+        if i not in depths:
+            if i in seen:
+                raise ValueError("Circular dependency involving %r" % (objects[i],))
+            deps = [objects.index(dep) for dep in get_dependencies(objects[i])
+                    if dep in objects and dep != objects[i]]
+            depths[i] = max([depth(d, seen | set([i])) + 1 for d in deps] or [0])
+        return depths[i]
+
+    layers = []
+    for i, obj in enumerate(objects):
+        d = depth(i, set())
+        while len(layers) <= d:
+            layers.append([])
+        layers[d].append(obj)
+    return layers
+
+
+def _call(func, i, obj, done):
+    try:
+        done.put((i, func(obj), None))
+    except Exception:
+        done.put((i, None, sys.exc_info()))
+
+
+def _worker(func, pending, done):
+    while True:
+        try:
+            i, obj = pending.get_nowait()
+        except Empty:
+            return
+        _call(func, i, obj, done)
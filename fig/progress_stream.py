@@ -1,5 +1,9 @@
+from threading import Lock
+import datetime
 import json
 import os
+import re
+import time
 import codecs
 
 
@@ -7,42 +11,259 @@ class StreamOutputError(Exception):
     pass
 
 
-def stream_output(output, stream):
-    is_terminal = hasattr(stream, 'fileno') and os.isatty(stream.fileno())
-    stream = codecs.getwriter('utf-8')(stream)
-    all_events = []
-    lines = {}
-    diff = 0
+WHITESPACE = re.compile(r'\s*')
+
+# The shortest time, in seconds, between redraws of progress on a terminal.
+FRAME_INTERVAL = 0.1
+
+# The shortest time, in seconds, between two JSON progress lines for the
+# same layer and status.
+PROGRESS_LOG_INTERVAL = 1.0
+
+# The ways build and pull progress can be shown: drawn for a person to read,
+# or as a line of JSON per event.
+PROGRESS_MODES = ('tty', 'json')
+
+
+def json_stream(output):
+    """
+    Yield the JSON documents in `output`, an iterable of chunks as read from
+    the daemon. A chunk may hold several documents or only part of one, and
+    a multi-byte character may be split across chunks.
+
+    Only what is left over after the last complete document is kept between
+    chunks, so long streams are decoded in linear time.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
 
     for chunk in output:
-        event = json.loads(chunk)
-        all_events.append(event)
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk)
+        buffer += chunk
+        position = WHITESPACE.match(buffer).end()
+        while position < len(buffer):
+            try:
+                document, end = decoder.raw_decode(buffer, idx=position)
+            except ValueError:
+                break
+            yield document
+            position = WHITESPACE.match(buffer, end).end()
+        buffer = buffer[position:]
+
+    buffer += utf8.decode(b'', True)
+    if buffer.strip():
+        raise StreamOutputError('Invalid JSON at the end of the stream: %r' % buffer[:100])
+
+
+def stream_events(output, consumers):
+    """
+    Pass each event decoded from `output` to each of `consumers` in turn.
+    Events are handled one at a time and none are kept, so memory use
+    doesn't grow with the length of the stream.
+    """
+    for event in json_stream(output):
+        for consumer in consumers:
+            consumer(event)
+
+
+def stream_output(output, stream, consumers=()):
+    """
+    Write the build or pull progress in `output` to `stream`, raising a
+    :class:`StreamOutputError` for the first error. Each event is first
+    passed to each of `consumers`, e.g. a :class:`BuildImageId`.
+    """
+    renderer = TerminalRenderer(stream)
+    try:
+        stream_events(output, list(consumers) + [raise_on_error, renderer])
+    finally:
+        renderer.finish()
+
+
+def raise_on_error(event):
+    if 'errorDetail' in event:
+        raise StreamOutputError(event['errorDetail']['message'])
+
+
+class BuildImageId(object):
+    """
+    Remembers the ID of the image that a build's output says was built.
+    """
+    def __init__(self):
+        self.image_id = None
+
+    def __call__(self, event):
+        match = re.search(r'Successfully built ([0-9a-f]+)', event.get('stream', ''))
+        if match:
+            self.image_id = match.group(1)
+
+
+class ProgressLog(object):
+    """
+    Writes build and pull events to `stream` as lines of compact JSON, each
+    with the name of the service it came from and the time it was read.
+
+    Progress within a layer's status is written at most once every
+    `interval` seconds for each layer; every change of status is written.
+    It is safe to share between services being built or pulled at once.
+    """
+    def __init__(self, stream, interval=None, clock=time.time):
+        self.stream = stream
+        self.interval = PROGRESS_LOG_INTERVAL if interval is None else interval
+        self.clock = clock
+        self.layers = {}
+        self.lock = Lock()
+
+    def consumer(self, service_name):
+        """Return a consumer for :func:`stream_events` that writes the
+        events of the service `service_name`.
+        """
+        return lambda event: self.write(service_name, event)
+
+    def write(self, service_name, event):
+        record = normalise_event(event)
+        if not record:
+            return
+
+        now = self.clock()
+        with self.lock:
+            if 'id' in record:
+                key = (service_name, record['id'])
+                previous = self.layers.get(key)
+                if ('progress' in record and previous is not None
+                        and previous[0] == record.get('status')
+                        and now - previous[1] < self.interval):
+                    return
+                self.layers[key] = (record.get('status'), now)
+
+            record['service'] = service_name
+            record['time'] = datetime.datetime.utcfromtimestamp(now).isoformat() + 'Z'
+            # Only ASCII is written, so the stream's encoding doesn't matter.
+            self.stream.write(json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n')
+            self.stream.flush()
+
+
+def normalise_event(event):
+    """
+    Return the parts of a build or pull event worth logging, with the same
+    keys whichever version of the daemon sent it.
+    """
+    record = {}
+    for key in ('id', 'status', 'from'):
+        if event.get(key):
+            record[key] = event[key]
+    if event.get('stream', '').strip():
+        record['stream'] = event['stream'].rstrip('\n')
+    if 'errorDetail' in event or 'error' in event:
+        record['error'] = (event.get('errorDetail') or {}).get('message') or event.get('error')
+    detail = event.get('progressDetail') or {}
+    if 'current' in detail:
+        record['progress'] = {'current': detail['current'], 'total': detail.get('total')}
+    return record
+
+
+class TerminalRenderer(object):
+    """
+    Writes events to `stream` as the docker client does.
+
+    On a terminal, each layer's progress is shown on its own line. Only the
+    latest state of each layer is kept, and the lines are redrawn at most
+    once every `interval` seconds, however fast events arrive. Elsewhere,
+    a layer's line is only written when its status changes, never for
+    progress within a status.
+    """
+    def __init__(self, stream, interval=None, clock=time.time):
+        self.is_terminal = hasattr(stream, 'fileno') and os.isatty(stream.fileno())
+        self.stream = codecs.getwriter('utf-8')(stream)
+        self.frames = FrameLimiter(interval, clock)
+        self.lines = {}
+        self.pending = {}
+        self.statuses = {}
+
+    def __call__(self, event):
+        layer_id = event.get('id')
+        if layer_id and 'stream' not in event:
+            if self.is_terminal:
+                self._update(layer_id, event)
+            elif self.statuses.get(layer_id) != event.get('status'):
+                self.statuses[layer_id] = event.get('status')
+                self.stream.write("%s\n" % format_progress_line(event, with_progress=False))
+                self.stream.flush()
+            return
 
         if 'progress' in event or 'progressDetail' in event:
-            image_id = event.get('id')
-            if not image_id:
-                continue
+            return
+
+        self.finish()
+        print_output_event(event, self.stream, False)
+        self.stream.flush()
+
+    def finish(self):
+        """Draw any layer states that are waiting for the next frame."""
+        if self.pending:
+            self._draw()
 
-            if image_id in lines:
-                diff = len(lines) - lines[image_id]
-            else:
-                lines[image_id] = len(lines)
-                stream.write("\n")
-                diff = 0
+    def _update(self, layer_id, event):
+        if layer_id not in self.lines:
+            self.lines[layer_id] = len(self.lines)
+            self.stream.write("\n")
+        self.pending[layer_id] = event
+        if self.frames.due():
+            self._draw()
 
-            if is_terminal:
-                # move cursor up `diff` rows
-                stream.write("%c[%dA" % (27, diff))
+    def _draw(self):
+        for layer_id, event in sorted(self.pending.items(), key=lambda item: self.lines[item[0]]):
+            redraw_line(self.stream, len(self.lines) - self.lines[layer_id], format_progress_line(event))
+        self.pending = {}
+        self.stream.flush()
 
-        print_output_event(event, stream, is_terminal)
 
-        if 'id' in event and is_terminal:
-            # move cursor back down
-            stream.write("%c[%dB" % (27, diff))
+class FrameLimiter(object):
+    """
+    Says whether enough time has passed since the last frame to draw
+    another, at most one every `interval` seconds (FRAME_INTERVAL by
+    default).
+    """
+    def __init__(self, interval=None, clock=time.time):
+        self.interval = FRAME_INTERVAL if interval is None else interval
+        self.clock = clock
+        self.last_frame = None
 
-        stream.flush()
+    def due(self):
+        now = self.clock()
+        if self.last_frame is not None and now - self.last_frame < self.interval:
+            return False
+        self.last_frame = now
+        return True
 
-    return all_events
+
+def redraw_line(stream, rows_up, text):
+    """Replace the text of the terminal line `rows_up` rows above the cursor."""
+    # move cursor up `rows_up` rows, erase the line, and move back down
+    stream.write("%c[%dA" % (27, rows_up))
+    stream.write("%c[2K\r%s" % (27, text))
+    stream.write("\r%c[%dB" % (27, rows_up))
+
+
+def format_progress_line(event, with_progress=True):
+    """Return the text of a layer's progress line for `event`."""
+    text = ''
+    if 'time' in event:
+        text += "[%s] " % event['time']
+    text += "%s: " % event['id']
+    if 'from' in event:
+        text += "(from %s) " % event['from']
+    text += event.get('status', '')
+
+    if not with_progress:
+        pass
+    elif event.get('progress'):
+        text += " %s" % event['progress']
+    elif 'current' in (event.get('progressDetail') or {}) and event['progressDetail'].get('total'):
+        detail = event['progressDetail']
+        text += " (%.1f%%)" % (float(detail['current']) / float(detail['total']) * 100)
+    return text
 
 
 def print_output_event(event, stream, is_terminal):
@@ -83,3 +304,109 @@ def print_output_event(event, stream, is_terminal):
         stream.write("%s%s" % (event['stream'], terminator))
     else:
         stream.write("%s%s\n" % (status, terminator))
+
+
+class ProgressBoard(object):
+    """
+    Shows the progress of several streams at once, one line per key. On a
+    terminal each key's line is updated in place, with the lines redrawn at
+    most once every `interval` seconds; otherwise a line is only written
+    when a key's status changes.
+    """
+    def __init__(self, stream, interval=None, clock=time.time):
+        self.is_terminal = hasattr(stream, 'fileno') and os.isatty(stream.fileno())
+        self.stream = codecs.getwriter('utf-8')(stream)
+        self.frames = FrameLimiter(interval, clock)
+        self.lines = {}
+        self.pending = {}
+        self.statuses = {}
+        self.lock = Lock()
+
+    def update(self, key, status, progress=None, layer=None):
+        """
+        Show `status` on `key`'s line. `layer` is the id of the image layer
+        the status is for, if any: off a terminal a status is written when it
+        changes for that layer, so interleaved layers don't repeat it.
+        """
+        if layer:
+            status = "%s: %s" % (layer, status)
+        with self.lock:
+            if self.is_terminal:
+                if key not in self.lines:
+                    self.lines[key] = len(self.lines)
+                    self.stream.write("\n")
+                self.pending[key] = "%s: %s" % (key, status)
+                if progress:
+                    self.pending[key] += " %s" % progress
+                if self.frames.due():
+                    self._draw()
+            elif self.statuses.get((key, layer)) != status:
+                self.stream.write("%s: %s\n" % (key, status))
+                self.stream.flush()
+
+            self.statuses[(key, layer)] = status
+
+    def finish(self):
+        """Draw any lines that are waiting for the next frame."""
+        with self.lock:
+            if self.pending:
+                self._draw()
+
+    def _draw(self):
+        for key, text in sorted(self.pending.items(), key=lambda item: self.lines[item[0]]):
+            redraw_line(self.stream, len(self.lines) - self.lines[key], text)
+        self.pending = {}
+        self.stream.flush()
+
+
+def stream_progress(output, board, key):
+    """Show the progress of a pull or push on `key`'s line of `board`."""
+    for event in json_stream(output):
+        if 'errorDetail' in event:
+            board.update(key, 'Error')
+            raise StreamOutputError(event['errorDetail']['message'])
+
+        board.update(key, event.get('status', ''), event.get('progress'), layer=event.get('id'))
+
+
+class PrefixedStream(object):
+    """
+    Writes each complete line written to it to `stream`, prefixed with
+    `prefix`, so that the output of several concurrent streams can be told
+    apart. Writes to `stream` are serialised with `lock`.
+    """
+    def __init__(self, stream, prefix, lock):
+        self.stream = stream
+        self.prefix = prefix
+        self.lock = lock
+        self.buffer = None
+
+    def write(self, data):
+        if self.buffer is None:
+            self.buffer = data[:0]
+        self.buffer += data
+        newline = newline_for(self.buffer)
+        while newline in self.buffer:
+            line, self.buffer = self.buffer.split(newline, 1)
+            self._write_line(line)
+
+    def flush(self):
+        with self.lock:
+            self.stream.flush()
+
+    def finish(self):
+        """Write out whatever is left of an unterminated last line."""
+        if self.buffer:
+            self._write_line(self.buffer)
+            self.buffer = self.buffer[:0]
+
+    def _write_line(self, line):
+        prefix = self.prefix
+        if isinstance(line, bytes):
+            prefix = prefix.encode('utf-8')
+        with self.lock:
+            self.stream.write(prefix + line + newline_for(line))
+
+
+def newline_for(data):
+    return b'\n' if isinstance(data, bytes) else u'\n'
@@ -1,9 +1,13 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
 import logging
+import sys
+from threading import Lock
 
-from .service import Service
+from .service import Service, get_container_index
 from .container import Container
+from .progress_stream import PrefixedStream, ProgressBoard
+from .parallel import dependency_layers, parallel_execute, parallel_execute_graph
 from docker.errors import APIError
 
 log = logging.getLogger(__name__)
@@ -50,27 +54,38 @@ class Project(object):
         self.client = client
 
     @classmethod
-    def from_dicts(cls, name, service_dicts, client):
+    def from_dicts(cls, name, service_dicts, client, build_cache=None, progress_log=None):
         """
         Construct a ServiceCollection from a list of dicts representing services.
+        If a :class:`fig.build_cache.BuildCache` is given, services skip
+        builds whose inputs haven't changed. If a
+        :class:`fig.progress_stream.ProgressLog` is given, build and pull
+        progress is written to it instead of being shown.
         """
         project = cls(name, [], client)
         for service_dict in sort_service_dicts(service_dicts):
             links = project.get_links(service_dict)
             volumes_from = project.get_volumes_from(service_dict)
 
-            project.services.append(Service(client=client, project=name, links=links, volumes_from=volumes_from, **service_dict))
+            project.services.append(Service(
+                client=client,
+                project=name,
+                links=links,
+                volumes_from=volumes_from,
+                build_cache=build_cache,
+                progress_log=progress_log,
+                **service_dict))
         return project
 
     @classmethod
-    def from_config(cls, name, config, client):
+    def from_config(cls, name, config, client, build_cache=None, progress_log=None):
         dicts = []
         for service_name, service in list(config.items()):
             if not isinstance(service, dict):
                 raise ConfigurationError('Service "%s" doesn\'t have any configuration options. All top level keys in your fig.yml must map to a dictionary of configuration options.' % service_name)
             service['name'] = service_name
             dicts.append(service)
-        return cls.from_dicts(name, dicts, client)
+        return cls.from_dicts(name, dicts, client, build_cache=build_cache, progress_log=progress_log)
 
     def get_service(self, name):
         """
@@ -149,49 +164,178 @@ class Project(object):
             service.start(**options)
 
     def stop(self, service_names=None, **options):
-        for service in reversed(self.get_services(service_names)):
-            service.stop(**options)
+        self._execute_in_reverse_layers(
+            service_names,
+            lambda service: service.containers(),
+            lambda service, container: service.stop_container(container, **options))
 
     def kill(self, service_names=None, **options):
-        for service in reversed(self.get_services(service_names)):
-            service.kill(**options)
+        self._execute_in_reverse_layers(
+            service_names,
+            lambda service: service.containers(),
+            lambda service, container: service.kill_container(container, **options))
 
     def restart(self, service_names=None, **options):
         for service in self.get_services(service_names):
             service.restart(**options)
 
-    def build(self, service_names=None, no_cache=False):
+    def build(self, service_names=None, no_cache=False, parallel=None, compress_level=None, minimal_context=False):
+        """
+        Build the services' images, several at a time. A service whose
+        Dockerfile is based on the image of another service being built is
+        only built once that one has finished. Services with the same build
+        directory are built once, and the image is tagged for each of them.
+
+        `compress_level` and `minimal_context` are passed on to
+        :meth:`fig.service.Service.build`.
+
+        When more than one image is built, each line of output is prefixed
+        with the name of the service it comes from.
+        """
+        services = []
         for service in self.get_services(service_names):
             if service.can_be_built():
-                service.build(no_cache)
+                services.append(service)
             else:
                 log.info('%s uses an image, skipping' % service.name)
 
-    def up(self, service_names=None, start_links=True, recreate=True, insecure_registry=False):
-        running_containers = []
-        for service in self.get_services(service_names, include_links=start_links):
+        self._build(services, no_cache=no_cache, parallel=parallel,
+                    compress_level=compress_level, minimal_context=minimal_context)
+
+    def _build(self, services, parallel=None, **options):
+        groups = group_by_build_context(services)
+        leaders = [group[0] for group in groups]
+        shared_with = dict((group[0].name, group[1:]) for group in groups)
+        base_images = dict((service.name, service.get_base_image()) for service in leaders)
+
+        def get_dependencies(leader):
+            base_image = base_images[leader.name]
+            if base_image is None:
+                return []
+            return [group[0] for group in groups
+                    if any(s.is_built_as(base_image) for s in group)]
+
+        lock = Lock()
+        prefix_width = max([len(service.name) for service in leaders] or [0])
+
+        def build_service(service):
+            if len(leaders) == 1:
+                return service.build(shared_with=shared_with[service.name], **options)
+
+            stream = PrefixedStream(sys.stdout, service.name.ljust(prefix_width) + ' | ', lock)
+            try:
+                return service.build(stream=stream, shared_with=shared_with[service.name], **options)
+            finally:
+                stream.finish()
+
+        def on_error(service, error):
+            log.error("Service '%s' failed to build: %s" % (service.name, getattr(error, 'reason', error)))
+
+        parallel_execute_graph(leaders, build_service, get_dependencies, limit=parallel, on_error=on_error)
+
+    def up(self, service_names=None, start_links=True, recreate=True, insecure_registry=False, parallel=None,
+           max_unavailable=None, max_surge=None, force_recreate=False):
+        """
+        Create and start containers for the services, each as soon as the
+        services it depends on are up, with no more than `parallel` services
+        being brought up at once.
+
+        If a service fails, the services that depend on it are not started,
+        but the others are allowed to finish before the error is raised.
+
+        `max_unavailable`, `max_surge` and `force_recreate` are passed on to
+        :meth:`fig.service.Service.recreate_containers`.
+        """
+        def up_service(service):
             if recreate:
-                for (_, container) in service.recreate_containers(insecure_registry=insecure_registry):
-                    running_containers.append(container)
+                tuples = service.recreate_containers(
+                    insecure_registry=insecure_registry,
+                    max_unavailable=max_unavailable,
+                    max_surge=max_surge,
+                    force=force_recreate,
+                )
+                return [container for (_, container) in tuples]
             else:
-                for container in service.start_or_create_containers(insecure_registry=insecure_registry):
-                    running_containers.append(container)
+                return service.start_or_create_containers(insecure_registry=insecure_registry)
+
+        def on_error(service, error):
+            log.error("Failed to start %s: %s" % (service.name, error))
+
+        services = self.get_services(service_names, include_links=start_links)
+
+        # Build missing images up front, so that services that share a build
+        # directory only build it once.
+        self._build([service for service in services if service.needs_build()], parallel=parallel)
 
-        return running_containers
+        results = parallel_execute_graph(
+            services,
+            up_service,
+            lambda service: service.get_dependencies(),
+            limit=parallel,
+            on_error=on_error,
+        )
+        return [container for containers in results for container in containers]
 
-    def pull(self, service_names=None, insecure_registry=False):
+    def pull(self, service_names=None, insecure_registry=False, parallel=None):
+        """
+        Pull the images of the services, each image only once and several at
+        a time, showing their progress together on stdout.
+        """
+        images = []
+        services = {}
         for service in self.get_services(service_names, include_links=True):
-            service.pull(insecure_registry=insecure_registry)
+            image_name = service.get_image_name()
+            if image_name is None:
+                continue
+            if image_name not in services:
+                images.append(image_name)
+                services[image_name] = []
+            services[image_name].append(service)
+
+        for image_name in images:
+            log.info('Pulling %s (%s)...' % (', '.join(s.name for s in services[image_name]), image_name))
+
+        board = ProgressBoard(sys.stdout)
+        try:
+            parallel_execute(
+                images,
+                lambda image_name: services[image_name][0].pull(insecure_registry=insecure_registry, board=board),
+                limit=parallel)
+        finally:
+            board.finish()
 
     def remove_stopped(self, service_names=None, **options):
-        for service in self.get_services(service_names):
-            service.remove_stopped(**options)
+        self._execute_in_reverse_layers(
+            service_names,
+            lambda service: service.stopped_containers(),
+            lambda service, container: service.remove_container(container, **options))
 
     def containers(self, service_names=None, stopped=False, one_off=False):
+        services = self.get_services(service_names)
+        projects = set(service.project for service in services)
+        project = projects.pop() if len(projects) == 1 else None
+        index = get_container_index(self.client, project=project, stopped=stopped)
         return [Container.from_ps(self.client, container)
-                for container in self.client.containers(all=stopped)
-                for service in self.get_services(service_names)
-                if service.has_container(container, one_off=one_off)]
+                for service in services
+                for container in index.find(service.project, service.name, one_off=one_off)]
+
+    def _execute_in_reverse_layers(self, service_names, get_containers, func):
+        """
+        Call `func(service, container)` for the containers of each service,
+        layer by layer in reverse dependency order, so that a service's
+        containers are handled before those of the services it depends on.
+        Every container in a layer is handled at once, up to the limit set by
+        FIG_PARALLEL.
+        """
+        layers = dependency_layers(
+            self.get_services(service_names),
+            lambda service: service.get_dependencies())
+
+        for services in reversed(layers):
+            pairs = [(service, container)
+                     for service in services
+                     for container in get_containers(service)]
+            parallel_execute(pairs, lambda pair: func(*pair))
 
     def _inject_links(self, acc, service):
         linked_names = service.get_linked_names()
@@ -208,6 +352,22 @@ class Project(object):
         return acc + linked_services
 
 
+def group_by_build_context(services):
+    """
+    Return lists of the services that are built from the same build
+    directory, in the order each list's first service appears.
+    """
+    groups = []
+    index = {}
+    for service in services:
+        key = service.build_context_key()
+        if key not in index:
+            index[key] = len(groups)
+            groups.append([])
+        groups[index[key]].append(service)
+    return groups
+
+
 class NoSuchService(Exception):
     def __init__(self, name):
         self.name = name
@@ -1,16 +1,29 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
 from collections import namedtuple
+import hashlib
+import json
 import logging
 import re
 import os
 from operator import attrgetter
 import sys
+from threading import Lock
 
 from docker.errors import APIError
 
-from .container import Container
-from .progress_stream import stream_output, StreamOutputError
+from .build_context import compress_stream, compression_level, stream_context
+from .container import Container, inspect_containers
+from .dockerfile import get_base_image, get_context_paths
+from .parallel import parallel_execute
+from .progress_stream import (
+    BuildImageId,
+    raise_on_error,
+    stream_events,
+    stream_output,
+    stream_progress,
+    StreamOutputError,
+)
 
 log = logging.getLogger(__name__)
 
@@ -52,6 +65,9 @@ DOCKER_CONFIG_HINTS = {
 
 VALID_NAME_CHARS = '[a-zA-Z0-9]'
 
+# The environment variable a container's configuration fingerprint is kept in.
+CONFIG_HASH_VARIABLE = 'FIG_CONFIG_HASH'
+
 
 class BuildError(Exception):
     def __init__(self, service, reason):
@@ -70,11 +86,46 @@ class ConfigError(ValueError):
 VolumeSpec = namedtuple('VolumeSpec', 'external internal mode')
 
 
+class NumberAllocator(object):
+    """
+    Hands out the numbers at the end of a service's container names. It is
+    seeded once with the numbers already in use, and can be shared by
+    threads creating containers at the same time.
+    """
+    def __init__(self, numbers=None):
+        self.lock = Lock()
+        self.in_use = set(numbers or [])
+
+    def peek(self):
+        """Return the number the next call to allocate() will return, unless
+        another thread gets there first.
+        """
+        with self.lock:
+            return self._next()
+
+    def allocate(self):
+        with self.lock:
+            number = self._next()
+            self.in_use.add(number)
+            return number
+
+    def release(self, number):
+        """Make `number` available again, once its container is gone or
+        couldn't be created.
+        """
+        with self.lock:
+            self.in_use.discard(number)
+
+    def _next(self):
+        return max(self.in_use) + 1 if self.in_use else 1
+
+
 ServiceName = namedtuple('ServiceName', 'project service number')
 
 
 class Service(object):
-    def __init__(self, name, client=None, project='default', links=None, volumes_from=None, **options):
+    def __init__(self, name, client=None, project='default', links=None, volumes_from=None, build_cache=None,
+                 progress_log=None, **options):
         if not re.match('^%s+$' % VALID_NAME_CHARS, name):
             raise ConfigError('Invalid service name "%s" - only %s are allowed' % (name, VALID_NAME_CHARS))
         if not re.match('^%s+$' % VALID_NAME_CHARS, project):
@@ -96,12 +147,20 @@ class Service(object):
         self.project = project
         self.links = links or []
         self.volumes_from = volumes_from or []
+        self.build_cache = build_cache
+        self.progress_log = progress_log
         self.options = options
+        self._allocators = {}
+        self._allocators_lock = Lock()
+        # Held while the image is built or pulled, so that containers being
+        # created at once only do it once.
+        self._image_lock = Lock()
+        self._pulled_images = set()
 
     def containers(self, stopped=False, one_off=False):
+        index = get_container_index(self.client, project=self.project, stopped=stopped)
         return [Container.from_ps(self.client, container)
-                for container in self.client.containers(all=stopped)
-                if self.has_container(container, one_off=one_off)]
+                for container in index.find(self.project, self.name, one_off=one_off)]
 
     def has_container(self, container, one_off=False):
         """Return True if `container` was created to fulfill this service."""
@@ -115,28 +174,31 @@ class Service(object):
         """Return a :class:`fig.container.Container` for this service. The
         container must be active, and match `number`.
         """
-        for container in self.client.containers():
-            if not self.has_container(container):
-                continue
-            _, _, container_number = parse_name(get_container_name(container))
-            if container_number == number:
-                return Container.from_ps(self.client, container)
-
-        raise ValueError("No container found for %s_%s" % (self.name, number))
+        index = get_container_index(self.client, project=self.project)
+        container = index.get(ServiceName(self.project, self.name, int(number)))
+        if container is None:
+            raise ValueError("No container found for %s_%s" % (self.name, number))
+        return Container.from_ps(self.client, container)
 
     def start(self, **options):
-        for c in self.containers(stopped=True):
+        containers = self.containers(stopped=True)
+        inspect_containers(containers, keys=['Status'])
+        for c in containers:
             self.start_container_if_stopped(c, **options)
 
     def stop(self, **options):
-        for c in self.containers():
-            log.info("Stopping %s..." % c.name)
-            c.stop(**options)
+        parallel_execute(self.containers(), lambda c: self.stop_container(c, **options))
+
+    def stop_container(self, container, **options):
+        log.info("Stopping %s..." % container.name)
+        container.stop(**options)
 
     def kill(self, **options):
-        for c in self.containers():
-            log.info("Killing %s..." % c.name)
-            c.kill(**options)
+        parallel_execute(self.containers(), lambda c: self.kill_container(c, **options))
+
+    def kill_container(self, container, **options):
+        log.info("Killing %s..." % container.name)
+        container.kill(**options)
 
     def restart(self, **options):
         for c in self.containers():
@@ -151,14 +213,19 @@ class Service(object):
         - stops containers until there are at most `desired_num` running
         - starts containers until there are at least `desired_num` running
         - removes all stopped containers
+
+        Containers are created, stopped and started several at a time.
         """
         if not self.can_be_scaled():
             raise CannotBeScaledError()
 
         # Create enough containers
         containers = self.containers(stopped=True)
-        while len(containers) < desired_num:
-            containers.append(self.create_container())
+        inspect_containers(containers, keys=['Status'])
+        if len(containers) < desired_num:
+            containers.extend(parallel_execute(
+                range(desired_num - len(containers)),
+                lambda _: self.create_container()))
 
         running_containers = []
         stopped_containers = []
@@ -170,72 +237,146 @@ class Service(object):
         running_containers.sort(key=lambda c: c.number)
         stopped_containers.sort(key=lambda c: c.number)
 
-        # Stop containers
-        while len(running_containers) > desired_num:
-            c = running_containers.pop()
-            log.info("Stopping %s..." % c.name)
-            c.stop(timeout=1)
-            stopped_containers.append(c)
+        # Stop containers, highest numbers first
+        if len(running_containers) > desired_num:
+            parallel_execute(
+                reversed(running_containers[desired_num:]),
+                lambda c: self.stop_container(c, timeout=1))
 
-        # Start containers
-        while len(running_containers) < desired_num:
-            c = stopped_containers.pop(0)
-            log.info("Starting %s..." % c.name)
-            self.start_container(c)
-            running_containers.append(c)
+        # Start containers, lowest numbers first
+        if len(running_containers) < desired_num:
+            def start(c):
+                log.info("Starting %s..." % c.name)
+                self.start_container(c)
+
+            parallel_execute(stopped_containers[:desired_num - len(running_containers)], start)
 
         self.remove_stopped()
 
     def remove_stopped(self, **options):
-        for c in self.containers(stopped=True):
-            if not c.is_running:
-                log.info("Removing %s..." % c.name)
-                c.remove(**options)
+        parallel_execute(self.stopped_containers(), lambda c: self.remove_container(c, **options))
+
+    def stopped_containers(self):
+        containers = self.containers(stopped=True)
+        inspect_containers(containers, keys=['Status'])
+        return [c for c in containers if not c.is_running]
+
+    def remove_container(self, container, **options):
+        log.info("Removing %s..." % container.name)
+        container.remove(**options)
+        self._release_number(container)
 
     def create_container(self, one_off=False, insecure_registry=False, **override_options):
         """
         Create a container for this service. If the image doesn't exist, attempt to pull
-        it.
+        it. If another container already has the name picked for it, try the next number.
         """
         container_options = self._get_container_create_options(override_options, one_off=one_off)
+
+        # The fingerprint is kept in the environment, as the Docker API
+        # versions we support have no labels.
+        container_options['environment'][CONFIG_HASH_VARIABLE] = self._config_hash(
+            container_options, override_options)
+
+        while True:
+            try:
+                return self._create_container_or_pull(container_options, insecure_registry)
+            except APIError as e:
+                if not is_name_conflict(e):
+                    self._allocator(one_off).release(parse_name(container_options['name']).number)
+                    raise
+                log.debug("%s already exists, trying the next number" % container_options['name'])
+                container_options['name'] = self._container_name(
+                    self._allocator(one_off).allocate(), one_off)
+
+    def _create_container_or_pull(self, container_options, insecure_registry):
+        catalogue = get_image_catalogue(self.client)
+        if catalogue is not None and container_options['image'] not in catalogue:
+            self._pull_missing_image(container_options['image'], insecure_registry)
+            return Container.create(self.client, **container_options)
+
         try:
             return Container.create(self.client, **container_options)
         except APIError as e:
             if e.response.status_code == 404 and e.explanation and 'No such image' in str(e.explanation):
-                log.info('Pulling image %s...' % container_options['image'])
-                output = self.client.pull(
-                    container_options['image'],
-                    stream=True,
-                    insecure_registry=insecure_registry
-                )
-                stream_output(output, sys.stdout)
+                self._pull_missing_image(container_options['image'], insecure_registry)
                 return Container.create(self.client, **container_options)
             raise
 
-    def recreate_containers(self, insecure_registry=False, **override_options):
+    def _pull_missing_image(self, image, insecure_registry):
+        with self._image_lock:
+            if image in self._pulled_images:
+                return
+            log.info('Pulling image %s...' % image)
+            output = self.client.pull(
+                image,
+                stream=True,
+                insecure_registry=insecure_registry
+            )
+            self._stream_output(output)
+            record_image(self.client, image)
+            self._pulled_images.add(image)
+
+    def recreate_containers(self, insecure_registry=False, max_unavailable=None, max_surge=None, force=False, **override_options):
         """
         If a container for this service doesn't exist, create and start one. If there are
         any, stop them, create+start new ones, and remove the old containers.
+
+        Containers that were created from the current image with the current
+        configuration (see :meth:`config_hash`) are only started if they're
+        stopped, unless `force` is True.
+
+        If `max_unavailable` or `max_surge` is given, the containers are
+        recreated in rolling batches; see :meth:`rolling_recreate`.
         """
         containers = self.containers(stopped=True)
         if not containers:
-            log.info("Creating %s..." % self._next_container_name(containers))
+            log.info("Creating %s..." % self._next_container_name())
             container = self.create_container(insecure_registry=insecure_registry, **override_options)
             self.start_container(container)
             return [(None, container)]
-        else:
-            tuples = []
 
+        tuples = []
+        if not force:
+            inspect_containers(containers)
+            config_hash = self.config_hash(override_options)
+            image_id = self.image_id()
+
+            stale = []
+            for c in containers:
+                if self.is_up_to_date(c, config_hash, image_id):
+                    if c.is_running:
+                        log.info("%s is up to date" % c.name)
+                    tuples.append((None, self.start_container_if_stopped(c)))
+                else:
+                    stale.append(c)
+            containers = stale
+
+        if max_unavailable is not None or max_surge is not None:
+            tuples.extend(self.rolling_recreate(
+                containers,
+                max_unavailable=max_unavailable or 0,
+                max_surge=max_surge or 0,
+                insecure_registry=insecure_registry,
+                **override_options))
+        else:
             for c in containers:
                 log.info("Recreating %s..." % c.name)
                 tuples.append(self.recreate_container(c, insecure_registry=insecure_registry, **override_options))
 
-            return tuples
+        return tuples
 
     def recreate_container(self, container, **override_options):
-        """Recreate a container. An intermediate container is created so that
-        the new container has the same name, while still supporting
-        `volumes-from` the original container.
+        """Recreate a container, so that the new container has the same name
+        and the original container's volumes.
+
+        The volumes are bound into the new container directly, using the host
+        paths in the original container's inspect data. If the daemon doesn't
+        report them, an intermediate container is created instead, so that
+        the new container can still use `volumes-from` the original.
+
+        Returns a tuple of the intermediate container (or None) and the new
+        container.
         """
         try:
             container.stop()
@@ -247,6 +388,19 @@ class Service(object):
             else:
                 raise
 
+        previous_volumes = get_container_volumes(container)
+        if previous_volumes is None:
+            return self._recreate_container_with_intermediate(container, **override_options)
+
+        container.remove()
+        self._release_number(container)
+
+        new_container = self.create_container(**override_options)
+        self.start_container(new_container, previous_volumes=previous_volumes)
+
+        return (None, new_container)
+
+    def _recreate_container_with_intermediate(self, container, **override_options):
         intermediate_container = Container.create(
             self.client,
             image=container.image,
@@ -256,6 +410,7 @@ class Service(object):
         intermediate_container.start(volumes_from=container.id)
         intermediate_container.wait()
         container.remove()
+        self._release_number(container)
 
         options = dict(override_options)
         new_container = self.create_container(**options)
@@ -265,6 +420,54 @@ class Service(object):
 
         return (intermediate_container, new_container)
 
+    def rolling_recreate(self, containers, max_unavailable=0, max_surge=0, **override_options):
+        """
+        Recreate `containers` in batches of `max_unavailable + max_surge`,
+        lowest numbers first, recreating every container in a batch at once.
+
+        The first `max_surge` containers of each batch are replaced, which
+        starts the new container before the old one is stopped, so no more
+        than `max_unavailable` containers are down at any time. Containers of
+        a service that binds fixed host ports can't run alongside their
+        replacements, so they're never surged.
+        """
+        if max_unavailable < 0 or max_surge < 0 or max_unavailable + max_surge < 1:
+            raise ValueError("max_unavailable and max_surge must not be negative, and one of them must be at least 1")
+
+        if max_surge and not self.can_be_scaled():
+            log.warning("%s binds fixed host ports, so its containers will be stopped before they are replaced" % self.name)
+            max_unavailable, max_surge = max(max_unavailable, 1), 0
+
+        containers = sorted(containers, key=attrgetter('number'))
+        batch_size = max_unavailable + max_surge
+
+        def recreate(position_and_container):
+            position, container = position_and_container
+            log.info("Recreating %s..." % container.name)
+            if position < max_surge:
+                return self.replace_container(container, **override_options)
+            return self.recreate_container(container, **override_options)
+
+        tuples = []
+        for start in range(0, len(containers), batch_size):
+            batch = containers[start:start + batch_size]
+            tuples.extend(parallel_execute(list(enumerate(batch)), recreate))
+        return tuples
+
+    def replace_container(self, container, **override_options):
+        """Replace a container with a new one that has its volumes. The new
+        container is started before the old one is stopped, so unlike
+        :meth:`recreate_container` it gets a new number.
+        """
+        new_container = self.create_container(**override_options)
+        self.start_container(new_container, intermediate_container=container)
+
+        container.stop()
+        container.remove()
+        self._release_number(container)
+
+        return (None, new_container)
+
     def start_container_if_stopped(self, container, **options):
         if container.is_running:
             return container
@@ -272,62 +475,94 @@ class Service(object):
             log.info("Starting %s..." % container.name)
             return self.start_container(container, **options)
 
-    def start_container(self, container=None, intermediate_container=None, **override_options):
+    def start_container(self, container=None, intermediate_container=None, previous_volumes=None, **override_options):
+        """
+        Start a container for this service, creating one if none is given.
+
+        `previous_volumes` maps paths inside the container to (host path,
+        writable) pairs, as returned by :func:`get_container_volumes`. They
+        are bound into the container unless its configuration binds something
+        else there.
+        """
         container = container or self.create_container(**override_options)
         options = dict(self.options, **override_options)
-        port_bindings = build_port_bindings(options.get('ports') or [])
-
-        volume_bindings = dict(
-            build_volume_binding(parse_volume_spec(volume))
-            for volume in options.get('volumes') or []
-            if ':' in volume)
+        start_options = self._get_container_start_options(options)
 
-        privileged = options.get('privileged', False)
-        net = options.get('net', 'bridge')
-        dns = options.get('dns', None)
-        dns_search = options.get('dns_search', None)
-        cap_add = options.get('cap_add', None)
-        cap_drop = options.get('cap_drop', None)
-
-        restart = parse_restart_spec(options.get('restart', None))
+        volume_bindings = start_options['binds']
+        bound_paths = set(binding['bind'] for binding in volume_bindings.values())
+        for internal, (external, writable) in (previous_volumes or {}).items():
+            if internal not in bound_paths:
+                volume_bindings[external] = {'bind': internal, 'ro': not writable}
 
         container.start(
             links=self._get_links(link_to_self=options.get('one_off', False)),
-            port_bindings=port_bindings,
-            binds=volume_bindings,
             volumes_from=self._get_volumes_from(intermediate_container),
-            privileged=privileged,
-            network_mode=net,
-            dns=dns,
-            dns_search=dns_search,
-            restart_policy=restart,
-            cap_add=cap_add,
-            cap_drop=cap_drop,
+            **start_options
         )
         return container
 
+    def _get_container_start_options(self, options):
+        """
+        The options to start a container with that come from the service's
+        configuration, i.e. everything but links and volumes-from.
+        """
+        return dict(
+            port_bindings=build_port_bindings(options.get('ports') or []),
+            binds=dict(
+                build_volume_binding(parse_volume_spec(volume))
+                for volume in options.get('volumes') or []
+                if ':' in volume),
+            privileged=options.get('privileged', False),
+            network_mode=options.get('net', 'bridge'),
+            dns=options.get('dns', None),
+            dns_search=options.get('dns_search', None),
+            restart_policy=parse_restart_spec(options.get('restart', None)),
+            cap_add=options.get('cap_add', None),
+            cap_drop=options.get('cap_drop', None),
+        )
+
     def start_or_create_containers(self, insecure_registry=False):
         containers = self.containers(stopped=True)
 
         if not containers:
-            log.info("Creating %s..." % self._next_container_name(containers))
+            log.info("Creating %s..." % self._next_container_name())
             new_container = self.create_container(insecure_registry=insecure_registry)
             return [self.start_container(new_container)]
         else:
+            inspect_containers(containers, keys=['Status'])
             return [self.start_container_if_stopped(c) for c in containers]
 
     def get_linked_names(self):
         return [s.name for (s, _) in self.links]
 
-    def _next_container_name(self, all_containers, one_off=False):
+    def get_dependencies(self):
+        """Return the services this service links to or mounts volumes from."""
+        return [s for (s, _) in self.links] + [s for s in self.volumes_from if isinstance(s, Service)]
+
+    def _next_container_name(self, one_off=False):
+        return self._container_name(self._allocator(one_off).peek(), one_off)
+
+    def _container_name(self, number, one_off=False):
         bits = [self.project, self.name]
         if one_off:
             bits.append('run')
-        return '_'.join(bits + [str(self._next_container_number(all_containers))])
+        return '_'.join(bits + [str(number)])
+
+    def _allocator(self, one_off=False):
+        """
+        Return the :class:`NumberAllocator` for this service's containers,
+        or its one-off containers. It is seeded from the container listing
+        the first time it is needed.
+        """
+        with self._allocators_lock:
+            if one_off not in self._allocators:
+                self._allocators[one_off] = NumberAllocator(
+                    c.number for c in self.containers(stopped=True, one_off=one_off))
+            return self._allocators[one_off]
 
-    def _next_container_number(self, all_containers):
-        numbers = [parse_name(c.name).number for c in all_containers]
-        return 1 if not numbers else max(numbers) + 1
+    def _release_number(self, container, one_off=False):
+        if one_off in self._allocators:
+            self._allocators[one_off].release(container.number)
 
     def _get_links(self, link_to_self):
         links = []
@@ -363,15 +598,19 @@ class Service(object):
         return volumes_from
 
     def _get_container_create_options(self, override_options, one_off=False):
+        container_options = self._get_container_config_options(override_options)
+        container_options['name'] = self._container_name(
+            self._allocator(one_off).allocate(),
+            one_off)
+
+        return container_options
+
+    def _get_container_config_options(self, override_options):
         container_options = dict(
             (k, self.options[k])
             for k in DOCKER_CONFIG_KEYS if k in self.options)
         container_options.update(override_options)
 
-        container_options['name'] = self._next_container_name(
-            self.containers(stopped=True, one_off=one_off),
-            one_off)
-
         # If a qualified hostname was given, split it into an
         # unqualified hostname and a domainname unless domainname
         # was also given explicitly. This matches the behavior of
@@ -403,8 +642,9 @@ class Service(object):
         container_options['environment'] = merge_environment(container_options)
 
         if self.can_be_built():
-            if len(self.client.images(name=self._build_tag_name())) == 0:
-                self.build()
+            with self._image_lock:
+                if self.needs_build():
+                    self.build()
             container_options['image'] = self._build_tag_name()
         else:
             container_options['image'] = self._get_image_name(container_options['image'])
@@ -416,44 +656,255 @@ class Service(object):
 
         return container_options
 
+    def config_hash(self, override_options=None):
+        """
+        A fingerprint of the configuration a new container for this service
+        would get: its create and start options, and the IDs of the
+        containers it links to or mounts volumes from. Containers are created
+        with it in their environment, as FIG_CONFIG_HASH.
+        """
+        override_options = override_options or {}
+        return self._config_hash(
+            self._get_container_config_options(override_options),
+            override_options)
+
+    def _config_hash(self, container_options, override_options):
+        volumes_from = []
+        for volume_source in self.volumes_from:
+            if isinstance(volume_source, Service):
+                volumes_from.extend(c.id for c in volume_source.containers(stopped=True))
+            else:
+                volumes_from.append(volume_source.id)
+
+        config = {
+            'create': dict((k, v) for (k, v) in container_options.items() if k != 'name'),
+            'start': self._get_container_start_options(dict(self.options, **override_options)),
+            'links': sorted(self._get_links(link_to_self=override_options.get('one_off', False))),
+            'link_ids': sorted(c.id for (service, _) in self.links for c in service.containers()),
+            'volumes_from': volumes_from,
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def image_id(self):
+        """
+        The ID of the image new containers are created from, or None if it
+        doesn't exist yet.
+        """
+        if self.can_be_built():
+            image_name = self._build_tag_name()
+        else:
+            image_name = self.get_image_name()
+        try:
+            return self.client.inspect_image(image_name)['Id']
+        except APIError:
+            return None
+
+    def is_up_to_date(self, container, config_hash, image_id):
+        """
+        Return True if `container` was created with the configuration
+        `config_hash` from the image `image_id`.
+        """
+        return (image_id is not None
+                and container.get('Image') == image_id
+                and container.environment.get(CONFIG_HASH_VARIABLE) == config_hash)
+
     def _get_image_name(self, image):
         repo, tag = parse_repository_tag(image)
         if tag == "":
             tag = "latest"
         return '%s:%s' % (repo, tag)
 
-    def build(self, no_cache=False):
-        log.info('Building %s...' % self.name)
+    def build(self, no_cache=False, stream=None, compress_level=None, minimal_context=False, shared_with=None):
+        """
+        Build this service's image and tag it, writing the build output to
+        `stream` (stdout by default). Return the new image's ID.
+
+        A local build directory is gzipped at `compress_level` on its way to
+        the daemon; see :func:`fig.build_context.compression_level` for the
+        default. If `minimal_context` is set, only the files its Dockerfile
+        adds or copies are sent, where they can be worked out.
+
+        If the service has a build cache and its Dockerfile, build context
+        and base image haven't changed since the image was last built, and
+        that image still exists, the build is skipped unless `no_cache` is
+        set.
+
+        `shared_with` is a list of other services with the same build
+        directory (see :meth:`build_context_key`). They are tagged with the
+        image rather than built again.
+        """
+        shared_with = shared_with or []
+        names = ', '.join([self.name] + [service.name for service in shared_with])
+
+        cache_key = self._build_cache_key()
+        if not no_cache:
+            image_id = self._get_cached_image(cache_key)
+            if image_id is not None:
+                log.info('%s is up to date' % names)
+                for service in shared_with:
+                    service.tag_image(image_id, cache_key)
+                return image_id
+
+        log.info('Building %s...' % names)
 
         build_output = self.client.build(
-            self.options['build'],
             tag=self._build_tag_name(),
             stream=True,
             rm=True,
             nocache=no_cache,
+            **self._build_context_options(compress_level, minimal_context)
         )
 
+        build_image_id = BuildImageId()
         try:
-            all_events = stream_output(build_output, sys.stdout)
+            self._stream_output(build_output, stream, [build_image_id])
         except StreamOutputError, e:
             raise BuildError(self, unicode(e))
 
-        image_id = None
-
-        for event in all_events:
-            if 'stream' in event:
-                match = re.search(r'Successfully built ([0-9a-f]+)', event.get('stream', ''))
-                if match:
-                    image_id = match.group(1)
-
+        image_id = build_image_id.image_id
         if image_id is None:
             raise BuildError(self)
 
+        if cache_key is not None:
+            self.build_cache.set(self._build_tag_name(), cache_key, image_id)
+
+        record_image(self.client, self._build_tag_name(), image_id)
+        for service in shared_with:
+            service.tag_image(image_id, cache_key)
+        return image_id
+
+    def tag_image(self, image_id, cache_key=None):
+        """
+        Tag the image `image_id` as this service's image, recording it in
+        the build cache under `cache_key` if one is given.
+        """
+        tag = self._build_tag_name()
+        self.client.tag(image_id, tag, force=True)
+        if cache_key is not None and self.build_cache is not None:
+            self.build_cache.set(tag, cache_key, image_id)
+        record_image(self.client, tag, image_id)
+
+    def needs_build(self):
+        """
+        Return True if this service is built and its image doesn't exist.
+        """
+        return self.can_be_built() and not has_image(self.client, self._build_tag_name())
+
+    def build_context_key(self):
+        """
+        A key that is the same for services whose images are built from the
+        same build directory, and so are the same image; or None if this
+        service uses an image.
+        """
+        if not self.can_be_built():
+            return None
+        path = self.options['build']
+        if os.path.isdir(path):
+            return os.path.abspath(path)
+        return path
+
+    def _build_context_options(self, compress_level=None, minimal_context=False):
+        """
+        The arguments that give `client.build` this service's build context.
+        A local build directory is streamed to the daemon as it is archived,
+        rather than archived in memory first.
+        """
+        path = self.options['build']
+        if not os.path.isdir(path):
+            return {'path': path}
+        include = None
+        if minimal_context:
+            if self._base_image_has_onbuild():
+                log.info("%s's base image may add files when it's built on, sending all of %s" % (self.name, path))
+            else:
+                include = get_context_paths(path)
+                if include is None:
+                    log.info("Can't tell which files %s's Dockerfile uses, sending all of %s" % (self.name, path))
+        exclude = self.build_cache.exclude(path) if self.build_cache is not None else None
+        context = stream_context(path, exclude=exclude, include=include)
+        level = compression_level(getattr(self.client, 'base_url', None), compress_level)
+        if not level:
+            return {'fileobj': context, 'custom_context': True}
+        return {'fileobj': compress_stream(context, level), 'custom_context': True, 'encoding': 'gzip'}
+
+    def _base_image_has_onbuild(self):
+        """
+        Return True if the base image has ONBUILD instructions, which may
+        ADD or COPY files the Dockerfile doesn't name, or if it isn't on the
+        daemon to be inspected.
+        """
+        base_image = self.get_base_image()
+        if base_image is None:
+            return False
+        try:
+            config = self.client.inspect_image(base_image).get('Config') or {}
+        except APIError:
+            return True
+        return bool(config.get('OnBuild'))
+
+    def _build_cache_key(self):
+        """
+        The build cache key for this service's image, or None if it has no
+        build cache or isn't built from a local directory.
+        """
+        if self.build_cache is None or not self.can_be_built():
+            return None
+        base_image_id = None
+        base_image = self.get_base_image()
+        if base_image is not None:
+            try:
+                base_image_id = self.client.inspect_image(base_image)['Id']
+            except APIError:
+                pass
+        return self.build_cache.key(self.options['build'], {
+            'rm': True,
+            'base_image': base_image_id,
+        })
+
+    def _get_cached_image(self, cache_key):
+        """
+        Return the ID of the image cached for `cache_key` if it still exists,
+        tagging it as this service's image if it no longer is.
+        """
+        if cache_key is None:
+            return None
+        tag = self._build_tag_name()
+        image_id = self.build_cache.get(tag, cache_key)
+        if image_id is None:
+            return None
+        try:
+            self.client.inspect_image(image_id)
+        except APIError:
+            return None
+        try:
+            tagged = self.client.inspect_image(tag)['Id']
+        except APIError:
+            tagged = None
+        if tagged is None or not is_same_image(tagged, image_id):
+            self.client.tag(image_id, tag, force=True)
+        record_image(self.client, tag, image_id)
         return image_id
 
     def can_be_built(self):
         return 'build' in self.options
 
+    def get_base_image(self):
+        """
+        The image named by the `FROM` line of this service's Dockerfile, or
+        None if it can't be read.
+        """
+        if not self.can_be_built():
+            return None
+        return get_base_image(self.options['build'])
+
+    def is_built_as(self, image):
+        """
+        Return True if `image` names the image this service is built and
+        tagged as.
+        """
+        repo, tag = parse_repository_tag(image)
+        return self.can_be_built() and repo == self._build_tag_name() and tag in ('', 'latest')
+
     def _build_tag_name(self):
         """
         The tag to give to images built for this service.
@@ -466,14 +917,47 @@ class Service(object):
                 return False
         return True
 
-    def pull(self, insecure_registry=False):
+    def get_image_name(self):
+        """
+        The image this service pulls, or None if it is built.
+        """
         if 'image' in self.options:
-            image_name = self._get_image_name(self.options['image'])
+            return self._get_image_name(self.options['image'])
+        return None
+
+    def pull(self, insecure_registry=False, board=None):
+        """
+        Pull this service's image, if it uses one. Progress is shown on a
+        line of `board`, a :class:`fig.progress_stream.ProgressBoard`, if
+        one is given.
+        """
+        image_name = self.get_image_name()
+        if image_name is None:
+            return
+
+        if board is None:
             log.info('Pulling %s (%s)...' % (self.name, image_name))
-            self.client.pull(
-                image_name,
-                insecure_registry=insecure_registry
-            )
+        output = self.client.pull(
+            image_name,
+            stream=True,
+            insecure_registry=insecure_registry
+        )
+        if board is None or self.progress_log is not None:
+            self._stream_output(output)
+        else:
+            stream_progress(output, board, image_name)
+        record_image(self.client, image_name)
+
+    def _stream_output(self, output, stream=None, consumers=()):
+        """
+        Show the build or pull progress in `output` on `stream` (stdout by
+        default), or write it to the service's progress log if it has one,
+        passing each event to `consumers` first.
+        """
+        if self.progress_log is None:
+            stream_output(output, stream or sys.stdout, consumers)
+        else:
+            stream_events(output, list(consumers) + [self.progress_log.consumer(self.name), raise_on_error])
 
 
 NAME_RE = re.compile(r'^([^_]+)_([^_]+)_(run_)?(\d+)$')
@@ -495,6 +979,115 @@ def parse_name(name):
     return ServiceName(project, service_name, int(suffix))
 
 
+class ContainerIndex(object):
+    """
+    The containers from a single GET /containers/json result, keyed by the
+    :class:`ServiceName` parsed from their names and whether they are one-off
+    containers. Containers whose names weren't given to them by fig are
+    ignored.
+    """
+    def __init__(self, containers):
+        self.containers = {}
+        self.services = {}
+
+        for container in containers:
+            name = get_container_name(container)
+            match = NAME_RE.match(name) if name else None
+            if match is None:
+                continue
+            project, service_name, run, number = match.groups()
+            one_off = run is not None
+            self.containers[(ServiceName(project, service_name, int(number)), one_off)] = container
+            self.services.setdefault((project, service_name, one_off), []).append(container)
+
+    def get(self, service_name, one_off=False):
+        """Return the container named by `service_name`, or None."""
+        return self.containers.get((service_name, one_off))
+
+    def find(self, project, service, one_off=False):
+        """Return all the containers for a service."""
+        return list(self.services.get((project, service, one_off), []))
+
+
+def get_container_index(client, project=None, stopped=False):
+    """
+    Return a :class:`ContainerIndex` of the running containers, or of all
+    containers if `stopped` is True. Only the containers of `project` are
+    guaranteed to be included.
+
+    A :class:`fig.snapshot.ContainerSnapshot` keeps its index between calls
+    and lets the daemon filter on the project name if it can; any other
+    client is listed afresh.
+    """
+    if hasattr(client, 'container_index'):
+        return client.container_index(project=project, stopped=stopped)
+    return ContainerIndex(client.containers(all=stopped, trunc=False))
+
+
+class ImageCatalogue(object):
+    """
+    The images on the daemon, by repository and tag, built from a single
+    listing and kept up to date as fig builds and pulls images, so that
+    whether an image exists can be answered without asking the daemon.
+    """
+    def __init__(self, images):
+        self.lock = Lock()
+        self.images = {}
+        for image in images:
+            for repo_tag in image.get('RepoTags') or []:
+                if repo_tag != '<none>:<none>':
+                    self.images[image_key(repo_tag)] = image.get('Id')
+
+    def __contains__(self, name):
+        return image_key(name) in self.images
+
+    def get(self, name):
+        """Return the ID of the image `name`, if it's known."""
+        return self.images.get(image_key(name))
+
+    def add(self, name, image_id=None):
+        with self.lock:
+            self.images[image_key(name)] = image_id
+
+
+def image_key(name):
+    repo, tag = parse_repository_tag(name)
+    return repo, tag or 'latest'
+
+
+def get_image_catalogue(client):
+    """
+    Return the :class:`ImageCatalogue` a :class:`fig.snapshot.ContainerSnapshot`
+    keeps, or None for any other client.
+    """
+    if hasattr(client, 'image_catalogue'):
+        return client.image_catalogue()
+    return None
+
+
+def has_image(client, name):
+    """Return True if the image `name` exists."""
+    catalogue = get_image_catalogue(client)
+    if catalogue is not None:
+        return name in catalogue
+    repo, _ = parse_repository_tag(name)
+    return len(client.images(name=repo)) > 0
+
+
+def record_image(client, name, image_id=None):
+    """Record that the image `name` has been built or pulled."""
+    catalogue = get_image_catalogue(client)
+    if catalogue is not None:
+        catalogue.add(name, image_id)
+
+
+def is_name_conflict(error):
+    """Return True if an :class:`APIError` from creating a container means
+    that its name is already taken.
+    """
+    return error.response is not None and error.response.status_code == 409
+
+
 def get_container_name(container):
     if not container.get('Name') and not container.get('Names'):
         return None
@@ -552,6 +1145,38 @@ def parse_repository_tag(s):
     return repo, tag
 
 
+def is_same_image(a, b):
+    """Return True if the image IDs `a` and `b`, either of which may be
+    truncated or prefixed with its digest algorithm, name the same image.
+    """
+    a = a.split(':')[-1]
+    b = b.split(':')[-1]
+    return a.startswith(b) or b.startswith(a)
+
+
+def get_container_volumes(container):
+    """
+    Return a dict mapping the paths of a container's volumes inside the
+    container to (host path, writable) pairs, from its inspect data. Return
+    None if the daemon doesn't report them.
+    """
+    container.inspect_if_not_inspected()
+    info = container.dictionary
+
+    if 'Mounts' in info:
+        return dict(
+            (mount['Destination'], (mount['Source'], mount.get('RW', True)))
+            for mount in info['Mounts'] or [])
+
+    if 'Volumes' in info:
+        writable = info.get('VolumesRW') or {}
+        return dict(
+            (internal, (external, writable.get(internal, True)))
+            for internal, external in (info['Volumes'] or {}).items())
+
+    return None
+
+
 def build_volume_binding(volume_spec):
     internal = {'bind': volume_spec.internal, 'ro': volume_spec.mode == 'ro'}
     external = os.path.expanduser(volume_spec.external)
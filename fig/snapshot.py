@@ -0,0 +1,205 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from threading import RLock
+
+from docker.utils import compare_version
+
+from .container import is_running_status
+from .service import ContainerIndex, ImageCatalogue
+
+
+# The first API version whose container list understands a `name` filter.
+NAME_FILTER_API_VERSION = '1.21'
+
+
+def is_running(container):
+    """Return True if a GET /containers/json entry describes a running
+    container.
+    """
+    return is_running_status(container.get('Status'))
+
+
+class ContainerSnapshot(object):
+    """
+    Wraps a docker client so that the container list is fetched from the
+    daemon at most once per command, then kept up to date as containers are
+    created, started, stopped and removed through the wrapper.
+
+    Listings filtered on a container name are cached separately, so that a
+    project's containers can be listed without fetching every container on
+    the host.
+
+    The daemon's images are listed at most once per command too, into an
+    :class:`fig.service.ImageCatalogue` that services add to as they build
+    and pull.
+
+    Every other call is passed through to the wrapped client, so a snapshot
+    can be handed to a :class:`fig.project.Project` and its services in
+    place of the client itself. It is safe to use from several threads.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.lock = RLock()
+        self._listings = {}
+        self._indexes = {}
+        self._unlisted = set()
+        self._api_version = None
+        self._images = None
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def containers(self, all=False, trunc=True, filters=None, **kwargs):
+        scope = get_name_scope(filters)
+        if kwargs or (filters and scope is None):
+            return self.client.containers(all=all, trunc=trunc, filters=filters, **kwargs)
+
+        with self.lock:
+            # Commands are never truncated in the cached listing, so that it
+            # can answer both kinds of call.
+            if scope not in self._listings:
+                if scope is None:
+                    self._listings[scope] = self.client.containers(all=True, trunc=False)
+                else:
+                    self._listings[scope] = self.client.containers(all=True, trunc=False, filters=filters)
+
+            return [c for c in self._listings[scope] if all or is_running(c)]
+
+    def container_index(self, project=None, stopped=False):
+        """Return a :class:`fig.service.ContainerIndex` of the running
+        containers, or of all containers if `stopped` is True.
+
+        If `project` is given and the daemon supports it, only containers
+        whose names contain the project prefix are listed.
+        """
+        filters = None
+        if project and self.supports_name_filter():
+            filters = {'name': '%s_' % project}
+
+        key = (get_name_scope(filters), stopped)
+        with self.lock:
+            if key not in self._indexes:
+                self._indexes[key] = ContainerIndex(
+                    self.containers(all=stopped, filters=filters))
+            return self._indexes[key]
+
+    def image_catalogue(self):
+        """Return a :class:`fig.service.ImageCatalogue` of the images on
+        the daemon, listed the first time it's asked for.
+        """
+        with self.lock:
+            if self._images is None:
+                self._images = ImageCatalogue(self.client.images())
+            return self._images
+
+    def supports_name_filter(self):
+        """Return True if the daemon's container list has a `name` filter.
+
+        The daemon is asked for its API version, once per snapshot: the
+        client is always created for an older version than the one the
+        filter arrived in, but a newer daemon applies it to requests made
+        with any version.
+        """
+        with self.lock:
+            if self._api_version is None:
+                self._api_version = self.client.version().get('ApiVersion') or ''
+        try:
+            return compare_version(NAME_FILTER_API_VERSION, self._api_version) >= 0
+        except ValueError:
+            return False
+
+    def invalidate(self):
+        """Forget all listings, so that the next call fetches them again."""
+        with self.lock:
+            self._listings = {}
+            self._indexes = {}
+            self._unlisted = set()
+
+    def create_container(self, *args, **kwargs):
+        response = self.client.create_container(*args, **kwargs)
+        name = kwargs.get('name') or ''
+        with self.lock:
+            self._unlisted.add(response['Id'])
+            for scope, listing in self._listings.items():
+                if scope is None or scope in name:
+                    listing.insert(0, {
+                        'Id': response['Id'],
+                        'Image': kwargs.get('image', args[0] if args else None),
+                        'Names': ['/' + name] if name else [],
+                    })
+            self._indexes = {}
+        return response
+
+    def start(self, container, *args, **kwargs):
+        self.client.start(container, *args, **kwargs)
+        self.record_status(container, 'Up Less than a second')
+
+    def restart(self, container, *args, **kwargs):
+        self.client.restart(container, *args, **kwargs)
+        self.record_status(container, 'Up Less than a second')
+
+    def stop(self, container, *args, **kwargs):
+        self.client.stop(container, *args, **kwargs)
+        self.record_status(container, None)
+
+    def kill(self, container, signal=None):
+        self.client.kill(container, signal=signal)
+        if signal in (None, 9, 'KILL', 'SIGKILL'):
+            self.record_status(container, None)
+        else:
+            # Other signals may or may not bring the container down.
+            self.invalidate()
+
+    def wait(self, container):
+        exit_code = self.client.wait(container)
+        self.record_status(container, 'Exited (%s) Less than a second ago' % exit_code)
+        return exit_code
+
+    def remove_container(self, container, *args, **kwargs):
+        self.client.remove_container(container, *args, **kwargs)
+        with self.lock:
+            for listing, entry in self._find(container):
+                listing.remove(entry)
+            self._indexes = {}
+
+    def record_status(self, container, status):
+        """Record the new status of `container`, as reported by the daemon or
+        an event. A status of None means the container is not running and the
+        daemon's status string is unknown.
+        """
+        with self.lock:
+            for _, entry in self._find(container):
+                if status is None:
+                    entry.pop('Status', None)
+                else:
+                    entry['Status'] = status
+            self._indexes = {}
+
+    def _find(self, container):
+        """Return (listing, entry) pairs for `container`, which may be an ID
+        or a dict as accepted by the client. If the container isn't known to
+        the snapshot at all, every listing is invalidated rather than left out
+        of date.
+        """
+        if isinstance(container, dict):
+            container = container.get('Id')
+        found = [(listing, entry)
+                 for listing in self._listings.values()
+                 for entry in listing
+                 if entry['Id'] == container]
+        if not found and container not in self._unlisted:
+            self.invalidate()
+        return found
+
+
+def get_name_scope(filters):
+    """Return the name a container listing is filtered on, or None if it is
+    unfiltered or filtered on anything else.
+    """
+    if filters and list(filters.keys()) == ['name']:
+        name = filters['name']
+        if isinstance(name, list) and len(name) == 1:
+            name = name[0]
+        if not isinstance(name, list):
+            return name
+    return None
@@ -119,13 +119,21 @@ class CLITestCase(DockerClientTestCase):
 
         old_ids = [c.id for c in service.containers()]
 
-        self.command.dispatch(['up', '-d'], None)
+        self.command.dispatch(['up', '-d', '--force-recreate'], None)
         self.assertEqual(len(service.containers()), 1)
 
         new_ids = [c.id for c in service.containers()]
 
         self.assertNotEqual(old_ids, new_ids)
 
+    def test_up_keeps_up_to_date_containers(self):
+        self.command.dispatch(['up', '-d'], None)
+        service = self.project.get_service('simple')
+        old_ids = [c.id for c in service.containers()]
+
+        self.command.dispatch(['up', '-d'], None)
+        self.assertEqual([c.id for c in service.containers()], old_ids)
+
     def test_up_with_keep_old(self):
         self.command.dispatch(['up', '-d'], None)
         service = self.project.get_service('simple')
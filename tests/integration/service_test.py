@@ -3,6 +3,8 @@ from __future__ import absolute_import
 import os
 from os import path
 
+import mock
+
 from fig import Service
 from fig.service import CannotBeScaledError
 from fig.container import Container
@@ -147,17 +149,33 @@ class ServiceTest(DockerClientTestCase):
 
         intermediate_container = tuples[0][0]
         new_container = tuples[0][1]
-        self.assertEqual(intermediate_container.dictionary['Config']['Entrypoint'], ['/bin/echo'])
+        self.assertIsNone(intermediate_container)
 
         self.assertEqual(new_container.dictionary['Config']['Entrypoint'], ['sleep'])
         self.assertEqual(new_container.dictionary['Config']['Cmd'], ['300'])
         self.assertIn('FOO=2', new_container.dictionary['Config']['Env'])
         self.assertEqual(new_container.name, 'figtest_db_1')
         self.assertEqual(new_container.inspect()['Volumes']['/etc'], volume_path)
-        self.assertIn(intermediate_container.id, new_container.dictionary['HostConfig']['VolumesFrom'])
 
         self.assertEqual(len(self.client.containers(all=True)), num_containers_before)
         self.assertNotEqual(old_container.id, new_container.id)
+
+    @mock.patch('fig.service.get_container_volumes', return_value=None)
+    def test_recreate_containers_with_intermediate_container(self, mock_get_volumes):
+        service = self.create_service(
+            'db',
+            volumes=['/etc'],
+            entrypoint=['sleep'],
+            command=['300']
+        )
+        old_container = service.create_container()
+        service.start_container(old_container)
+        volume_path = old_container.inspect()['Volumes']['/etc']
+
+        intermediate_container, new_container = service.recreate_containers()[0]
+        self.assertEqual(intermediate_container.dictionary['Config']['Entrypoint'], ['/bin/echo'])
+        self.assertEqual(new_container.inspect()['Volumes']['/etc'], volume_path)
+        self.assertIn(intermediate_container.id, new_container.dictionary['HostConfig']['VolumesFrom'])
         self.assertRaises(APIError,
                           self.client.inspect_container,
                           intermediate_container.id)
@@ -0,0 +1,127 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+
+from .. import unittest
+import docker
+import mock
+from docker.errors import APIError
+
+from fig.build_cache import BuildCache
+from fig.service import Service
+
+
+class BuildCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(self.path, 'Dockerfile'), 'w') as f:
+            f.write('FROM busybox\n')
+        self.cache = BuildCache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_get_and_set(self):
+        key = self.cache.key(self.path, {'rm': True})
+        self.assertIsNone(self.cache.get('figtest_web', key))
+        self.cache.set('figtest_web', key, 'abc123')
+        self.assertEqual(BuildCache(self.path).get('figtest_web', key), 'abc123')
+        self.assertIsNone(self.cache.get('figtest_web', 'other'))
+
+    def test_key_depends_on_options(self):
+        self.assertNotEqual(
+            self.cache.key(self.path, {'rm': True}),
+            self.cache.key(self.path, {'rm': False}))
+
+    def test_key_ignores_the_cache_itself(self):
+        key = self.cache.key(self.path, {})
+        self.cache.set('figtest_web', key, 'abc123')
+        self.assertEqual(self.cache.key(self.path, {}), key)
+
+    def test_key_is_none_for_remote_build_paths(self):
+        self.assertIsNone(self.cache.key('github.com/docker/fig', {}))
+
+    def test_corrupt_cache_is_ignored(self):
+        os.makedirs(os.path.dirname(self.cache.path))
+        with open(self.cache.path, 'w') as f:
+            f.write('{not json')
+        self.assertIsNone(self.cache.get('figtest_web', 'key'))
+
+
+class ServiceBuildCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(self.path, 'Dockerfile'), 'w') as f:
+            f.write('FROM busybox\n')
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.inspect_image.side_effect = lambda image: {'Id': 'f' * 64}
+        self.mock_client.build.return_value = iter([
+            json.dumps({'stream': 'Successfully built abc123\n'}),
+        ])
+        self.service = Service(
+            'web', client=self.mock_client, project='figtest',
+            build=self.path, build_cache=BuildCache(self.path))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_build_skipped_when_nothing_changed(self):
+        with mock.patch('sys.stdout'):
+            self.assertEqual(self.service.build(), 'abc123')
+            self.assertEqual(self.service.build(), 'abc123')
+        self.assertEqual(self.mock_client.build.call_count, 1)
+
+    def test_build_retags_cached_image(self):
+        with mock.patch('sys.stdout'):
+            self.service.build()
+        self.service.build()
+        self.mock_client.tag.assert_called_once_with('abc123', 'figtest_web', force=True)
+
+    def test_build_when_cached_image_is_gone(self):
+        with mock.patch('sys.stdout'):
+            self.service.build()
+
+        def inspect_image(image):
+            if image == 'abc123':
+                raise APIError(None, None, 'No such image')
+            return {'Id': 'f' * 64}
+        self.mock_client.inspect_image.side_effect = inspect_image
+        self.mock_client.build.return_value = iter([
+            json.dumps({'stream': 'Successfully built def456\n'}),
+        ])
+        with mock.patch('sys.stdout'):
+            self.assertEqual(self.service.build(), 'def456')
+        self.assertEqual(self.mock_client.build.call_count, 2)
+
+    def test_build_when_context_changed(self):
+        with mock.patch('sys.stdout'):
+            self.service.build()
+        with open(os.path.join(self.path, 'Dockerfile'), 'a') as f:
+            f.write('RUN true\n')
+        self.mock_client.build.return_value = iter([
+            json.dumps({'stream': 'Successfully built def456\n'}),
+        ])
+        with mock.patch('sys.stdout'):
+            self.assertEqual(self.service.build(), 'def456')
+
+    def test_build_no_cache_always_builds(self):
+        with mock.patch('sys.stdout'):
+            self.service.build()
+            self.mock_client.build.return_value = iter([
+                json.dumps({'stream': 'Successfully built def456\n'}),
+            ])
+            self.assertEqual(self.service.build(no_cache=True), 'def456')
+
+    def test_build_leaves_the_cache_out_of_the_context(self):
+        self.service.build_cache.set('figtest_other', 'key', 'def456')
+        with mock.patch('sys.stdout'):
+            self.service.build()
+        context = b''.join(self.mock_client.build.call_args[1]['fileobj'])
+        self.assertEqual(tarfile.open(fileobj=io.BytesIO(context)).getnames(), ['Dockerfile'])
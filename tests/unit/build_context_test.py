@@ -0,0 +1,227 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+
+from .. import unittest
+import docker
+import mock
+import six
+
+from fig.build_context import (
+    DEFAULT_COMPRESSION_LEVEL,
+    compress_stream,
+    compression_level,
+    context_hash,
+    parse_compression_level,
+    stream_context,
+    walk_context,
+)
+from fig.service import Service
+
+
+class BuildContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.write('Dockerfile', 'FROM busybox\n')
+        self.write('app/main.py', 'print 1\n')
+        self.write('app/main.pyc', '')
+        self.write('logs/debug.log', '')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, content):
+        filename = os.path.join(self.path, *name.split('/'))
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'w') as f:
+            f.write(content)
+
+    def test_walk_context(self):
+        self.assertEqual(list(walk_context(self.path)), [
+            'Dockerfile', 'app', 'app/main.py', 'app/main.pyc', 'logs', 'logs/debug.log',
+        ])
+
+    def test_walk_context_honours_dockerignore(self):
+        self.write('.dockerignore', '# comment\nlogs/\napp/*.pyc\nDockerfile\n')
+        self.assertEqual(list(walk_context(self.path)), [
+            '.dockerignore', 'Dockerfile', 'app', 'app/main.py',
+        ])
+
+    def test_walk_context_with_include(self):
+        self.assertEqual(list(walk_context(self.path, include=['Dockerfile', 'app/main.py'])), [
+            'Dockerfile', 'app', 'app/main.py',
+        ])
+        self.assertEqual(list(walk_context(self.path, include=['logs'])), [
+            'logs', 'logs/debug.log',
+        ])
+
+    def test_context_hash_changes_with_content(self):
+        before = context_hash(self.path)
+        self.assertEqual(context_hash(self.path), before)
+        self.write('app/main.py', 'print 2\n')
+        self.assertNotEqual(context_hash(self.path), before)
+
+    def test_context_hash_ignores_excluded_files(self):
+        self.write('.dockerignore', 'logs\n')
+        before = context_hash(self.path)
+        self.write('logs/debug.log', 'changed')
+        self.assertEqual(context_hash(self.path), before)
+
+    def test_non_ascii_names_in_a_byte_string_path(self):
+        path = self.path
+        if isinstance(path, six.text_type):
+            path = path.encode(sys.getfilesystemencoding())
+        filename = os.path.join(path, b'app', 'caf\u00e9.txt'.encode('utf-8'))
+        with open(filename, 'wb') as f:
+            f.write(b'one')
+
+        self.assertIn('app/caf\u00e9.txt', list(walk_context(path)))
+        before = context_hash(path)
+        with open(filename, 'wb') as f:
+            f.write(b'two')
+        self.assertNotEqual(context_hash(path), before)
+
+    def read_stream(self, **kwargs):
+        chunks = list(stream_context(self.path, **kwargs))
+        return chunks, tarfile.open(fileobj=io.BytesIO(b''.join(chunks)))
+
+    def test_stream_context(self):
+        self.write('.dockerignore', 'logs\n')
+        os.symlink('main.py', os.path.join(self.path, 'app', 'link.py'))
+        _, tar = self.read_stream()
+        self.assertEqual(tar.getnames(), [
+            '.dockerignore', 'Dockerfile', 'app', 'app/link.py', 'app/main.py', 'app/main.pyc',
+        ])
+        self.assertEqual(tar.extractfile('app/main.py').read(), b'print 1\n')
+        self.assertTrue(tar.getmember('app').isdir())
+        self.assertEqual(tar.getmember('app/link.py').linkname, 'main.py')
+
+    def test_stream_context_is_chunked(self):
+        self.write('big', 'x' * 100000)
+        chunks, tar = self.read_stream(chunk_size=1024)
+        self.assertTrue(max(len(c) for c in chunks) <= 1024)
+        self.assertEqual(len(tar.extractfile('big').read()), 100000)
+
+    def test_stream_context_with_non_ascii_names(self):
+        path = self.path
+        if isinstance(path, six.text_type):
+            path = path.encode(sys.getfilesystemencoding())
+        with open(os.path.join(path, b'app', 'caf\u00e9.txt'.encode('utf-8')), 'wb') as f:
+            f.write(b'content')
+        tar = tarfile.open(fileobj=io.BytesIO(b''.join(stream_context(path))), encoding='utf-8')
+        name = 'app/caf\u00e9.txt'
+        if six.PY2:
+            name = name.encode('utf-8')
+        self.assertEqual(tar.extractfile(name).read(), b'content')
+
+    @unittest.skipUnless(hasattr(os, 'mkfifo'), 'needs named pipes')
+    def test_stream_context_with_a_fifo(self):
+        os.mkfifo(os.path.join(self.path, 'app', 'pipe'))
+        _, tar = self.read_stream()
+        self.assertTrue(tar.getmember('app/pipe').isfifo())
+        self.assertEqual(tar.extractfile('app/main.py').read(), b'print 1\n')
+
+    def test_stream_context_with_long_names(self):
+        name = '/'.join(['directory'] * 15)
+        self.write(name + '/file', 'content')
+        _, tar = self.read_stream()
+        self.assertEqual(tar.extractfile(name + '/file').read(), b'content')
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_compression_level_is_automatic(self):
+        with mock.patch.dict(os.environ, {'FIG_BUILD_COMPRESSION': ''}):
+            self.assertEqual(compression_level('http+unix://var/run/docker.sock'), 0)
+            self.assertEqual(compression_level(None), 0)
+            self.assertEqual(compression_level('https://192.168.59.103:2376'), DEFAULT_COMPRESSION_LEVEL)
+
+    def test_compression_level_from_environment(self):
+        with mock.patch.dict(os.environ, {'FIG_BUILD_COMPRESSION': '9'}):
+            self.assertEqual(compression_level('http+unix://var/run/docker.sock'), 9)
+        with mock.patch.dict(os.environ, {'FIG_BUILD_COMPRESSION': '0'}):
+            self.assertEqual(compression_level('https://192.168.59.103:2376'), 0)
+        with mock.patch.dict(os.environ, {'FIG_BUILD_COMPRESSION': 'lots'}):
+            self.assertEqual(compression_level('https://192.168.59.103:2376'), DEFAULT_COMPRESSION_LEVEL)
+
+    def test_compression_level_given(self):
+        with mock.patch.dict(os.environ, {'FIG_BUILD_COMPRESSION': '9'}):
+            self.assertEqual(compression_level('https://192.168.59.103:2376', 1), 1)
+
+    def test_parse_compression_level(self):
+        self.assertEqual(parse_compression_level('3'), 3)
+        self.assertRaises(ValueError, parse_compression_level, '10')
+        self.assertRaises(ValueError, parse_compression_level, 'fast')
+
+    def test_compress_stream(self):
+        chunks = [b'a' * 1000, b'', b'b' * 1000]
+        compressed = b''.join(compress_stream(chunks, 6))
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(compressed)).read(), b''.join(chunks))
+
+
+class ServiceBuildContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(self.path, 'Dockerfile'), 'w') as f:
+            f.write('FROM busybox\n')
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.inspect_image.side_effect = lambda image: {'Id': 'f' * 64}
+        self.mock_client.build.return_value = iter([
+            json.dumps({'stream': 'Successfully built abc123\n'}),
+        ])
+        self.service = Service('web', client=self.mock_client, project='figtest', build=self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_build_compresses_context_for_remote_daemon(self):
+        self.mock_client.base_url = 'https://192.168.59.103:2376'
+        with mock.patch.dict(os.environ, {'FIG_BUILD_COMPRESSION': ''}):
+            with mock.patch('sys.stdout'):
+                self.service.build()
+        kwargs = self.mock_client.build.call_args[1]
+        self.assertEqual(kwargs['encoding'], 'gzip')
+        self.assertTrue(kwargs['custom_context'])
+        self.assertIn(b'FROM busybox', gzip.GzipFile(fileobj=io.BytesIO(b''.join(kwargs['fileobj']))).read())
+
+    def test_build_does_not_compress_context_for_local_daemon(self):
+        with mock.patch.dict(os.environ, {'FIG_BUILD_COMPRESSION': ''}):
+            with mock.patch('sys.stdout'):
+                self.service.build()
+        self.assertNotIn('encoding', self.mock_client.build.call_args[1])
+
+    def test_build_with_minimal_context(self):
+        with open(os.path.join(self.path, 'Dockerfile'), 'w') as f:
+            f.write('FROM busybox\nADD app.sh /\n')
+        for name in ['app.sh', 'data.bin']:
+            open(os.path.join(self.path, name), 'w').close()
+        with mock.patch('sys.stdout'):
+            self.service.build(minimal_context=True)
+        context = b''.join(self.mock_client.build.call_args[1]['fileobj'])
+        names = tarfile.open(fileobj=io.BytesIO(context)).getnames()
+        self.assertEqual(names, ['Dockerfile', 'app.sh'])
+
+    def test_build_with_minimal_context_sends_everything_for_onbuild_base_image(self):
+        with open(os.path.join(self.path, 'Dockerfile'), 'w') as f:
+            f.write('FROM busybox-onbuild\nADD app.sh /\n')
+        for name in ['app.sh', 'data.bin']:
+            open(os.path.join(self.path, name), 'w').close()
+        self.mock_client.inspect_image.side_effect = lambda image: {
+            'Id': 'f' * 64,
+            'Config': {'OnBuild': ['COPY . /app']},
+        }
+        with mock.patch('sys.stdout'):
+            self.service.build(minimal_context=True)
+        context = b''.join(self.mock_client.build.call_args[1]['fileobj'])
+        names = tarfile.open(fileobj=io.BytesIO(context)).getnames()
+        self.assertEqual(names, ['Dockerfile', 'app.sh', 'data.bin'])
@@ -4,9 +4,11 @@ import logging
 import os
 from .. import unittest
 
+import docker
 import mock
 
 from fig.cli import main
+from fig.cli.errors import UserError
 from fig.cli.main import TopLevelCommand
 from six import StringIO
 
@@ -58,6 +60,39 @@ class CLITestCase(unittest.TestCase):
         self.assertTrue(project.client)
         self.assertTrue(project.services)
 
+    @mock.patch('fig.cli.command.docker_client', autospec=True)
+    def test_get_project_lists_containers_by_name_on_newer_daemon(self, mock_docker_client):
+        client = mock_docker_client.return_value = mock.create_autospec(docker.Client)
+        client._version = '1.14'
+        client.version.return_value = {'ApiVersion': '1.21'}
+        client.containers.return_value = []
+        command = TopLevelCommand()
+        command.base_dir = 'tests/fixtures/longer-filename-figfile'
+        project = command.get_project(command.get_config_path())
+        project.containers(stopped=True)
+        project.containers(one_off=True)
+        client.containers.assert_called_once_with(
+            all=True, trunc=False, filters={'name': 'longerfilenamefigfile_'})
+        client.version.assert_called_once_with()
+
+    def test_get_project_with_json_progress(self):
+        command = TopLevelCommand()
+        command.base_dir = 'tests/fixtures/longer-filename-figfile'
+        with mock.patch.dict(os.environ, {'FIG_PROGRESS': ''}):
+            project = command.get_project(command.get_config_path())
+            self.assertIsNone(project.services[0].progress_log)
+            project = command.get_project(command.get_config_path(), progress='json')
+            self.assertIsNotNone(project.services[0].progress_log)
+
+    def test_get_progress_mode(self):
+        command = TopLevelCommand()
+        with mock.patch.dict(os.environ, {'FIG_PROGRESS': 'json'}):
+            self.assertEqual(command.get_progress_mode(), 'json')
+            self.assertEqual(command.get_progress_mode('tty'), 'tty')
+        with mock.patch.dict(os.environ, {'FIG_PROGRESS': ''}):
+            self.assertEqual(command.get_progress_mode(), 'tty')
+        self.assertRaises(UserError, command.get_progress_mode, 'fancy')
+
     def test_help(self):
         command = TopLevelCommand()
         with self.assertRaises(SystemExit):
@@ -4,7 +4,7 @@ from .. import unittest
 import mock
 import docker
 
-from fig.container import Container
+from fig.container import Container, inspect_containers
 
 
 class ContainerTest(unittest.TestCase):
@@ -36,6 +36,55 @@ class ContainerTest(unittest.TestCase):
             "Name": "/figtest_db_1",
         })
 
+    def test_from_ps_keeps_ps_view(self):
+        container = Container.from_ps(None, self.container_dict)
+        self.assertEqual(container.ps_view, self.container_dict)
+        self.assertFalse(container.has_been_inspected)
+
+    def test_human_readable_from_ps_view(self):
+        self.container_dict['Ports'] = [
+            {"PrivatePort": 45454, "PublicPort": 49197, "Type": "tcp", "IP": "0.0.0.0"},
+            {"PrivatePort": 45453, "Type": "tcp"},
+        ]
+        container = Container.from_ps(None, self.container_dict)
+
+        self.assertTrue(container.is_running)
+        self.assertEqual(container.human_readable_state, 'Up')
+        self.assertEqual(container.human_readable_command, 'sleep 300')
+        self.assertEqual(
+            container.human_readable_ports,
+            "45453/tcp, 0.0.0.0:49197->45454/tcp")
+
+    def test_human_readable_state_exited_from_ps_view(self):
+        self.container_dict['Status'] = 'Exited (137) 2 minutes ago'
+        container = Container.from_ps(None, self.container_dict)
+        self.assertFalse(container.is_running)
+        self.assertEqual(container.human_readable_state, 'Exit 137')
+
+    def test_human_readable_state_falls_back_to_inspect(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.inspect_container.return_value = {
+            'Id': 'abc',
+            'State': {'Running': False, 'ExitCode': 0},
+        }
+        self.container_dict['Status'] = ''
+        container = Container.from_ps(mock_client, self.container_dict)
+
+        self.assertEqual(container.human_readable_state, 'Exit 0')
+        mock_client.inspect_container.assert_called_once_with('abc')
+
+    def test_is_running_without_status_inspects(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.inspect_container.return_value = {
+            'Id': 'abc',
+            'State': {'Running': True},
+        }
+        del self.container_dict['Status']
+        container = Container.from_ps(mock_client, self.container_dict)
+
+        self.assertTrue(container.is_running)
+        mock_client.inspect_container.assert_called_once_with('abc')
+
     def test_environment(self):
         container = Container(None, {
             'Id': 'abc',
@@ -82,6 +131,22 @@ class ContainerTest(unittest.TestCase):
         container.inspect_if_not_inspected()
         self.assertEqual(mock_client.inspect_container.call_count, 1)
 
+    def test_inspect_containers(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.inspect_container.side_effect = lambda id: dict(Id=id, Inspected=True)
+        containers = [
+            Container(mock_client, dict(Id="a")),
+            Container(mock_client, dict(Id="b"), has_been_inspected=True),
+            Container(mock_client, dict(Id="c")),
+        ]
+
+        inspect_containers(containers)
+        self.assertEqual(
+            sorted(call[0][0] for call in mock_client.inspect_container.call_args_list),
+            ["a", "c"])
+        self.assertTrue(all(c.has_been_inspected for c in containers))
+        self.assertEqual(containers[2].dictionary, dict(Id="c", Inspected=True))
+
     def test_human_readable_ports_none(self):
         container = Container(None, self.container_dict, has_been_inspected=True)
         self.assertEqual(container.human_readable_ports, '')
@@ -117,3 +182,13 @@ class ContainerTest(unittest.TestCase):
         self.assertEqual(container.get('Status'), "Up 8 seconds")
         self.assertEqual(container.get('HostConfig.VolumesFrom'), ["volume_id",])
         self.assertEqual(container.get('Foo.Bar.DoesNotExist'), None)
+
+    def test_inspect_containers_with_keys(self):
+        mock_client = mock.create_autospec(docker.Client)
+        containers = [
+            Container.from_ps(mock_client, self.container_dict),
+            Container.from_ps(mock_client, dict(Id="def", Image="busybox", Names=[])),
+        ]
+
+        inspect_containers(containers, keys=['Status', 'Command'])
+        mock_client.inspect_container.assert_called_once_with("def")
@@ -0,0 +1,88 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+
+from .. import unittest
+
+from fig.dockerfile import get_base_image, get_context_paths, get_sources, parse_dockerfile
+
+
+class DockerfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, content):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        with open(os.path.join(self.path, 'Dockerfile'), 'wb') as f:
+            f.write(content)
+
+    def test_parse_dockerfile(self):
+        self.write(
+            '# A comment\n'
+            'from busybox\n'
+            '\n'
+            'RUN echo one && \\\n'
+            '    # a comment in a continuation\n'
+            '    echo two\n'
+            'CMD ["top"]\n')
+        self.assertEqual(parse_dockerfile(os.path.join(self.path, 'Dockerfile')), [
+            ('FROM', 'busybox'),
+            ('RUN', 'echo one &&  echo two'),
+            ('CMD', '["top"]'),
+        ])
+
+    def test_get_base_image(self):
+        self.write('# syntax\nFROM figtest_base:latest\nRUN true\n')
+        self.assertEqual(get_base_image(self.path), 'figtest_base:latest')
+
+    def test_get_base_image_with_non_ascii_dockerfile(self):
+        self.write('# Maintainer: Jos\u00e9\nFROM busybox\n')
+        self.assertEqual(get_base_image(self.path), 'busybox')
+        self.assertEqual(get_context_paths(self.path), ['Dockerfile'])
+
+    def test_get_base_image_with_undecodable_dockerfile(self):
+        self.write(b'# Maintainer: Jos\xe9\nFROM busybox\n')
+        self.assertIsNone(get_base_image(self.path))
+        self.assertIsNone(get_context_paths(self.path))
+
+    def test_get_base_image_without_dockerfile(self):
+        self.assertEqual(get_base_image(self.path), None)
+        self.assertEqual(get_base_image('git://github.com/docker/fig'), None)
+
+    def touch(self, name):
+        filename = os.path.join(self.path, *name.split('/'))
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        open(filename, 'w').close()
+
+    def test_get_sources(self):
+        self.assertEqual(get_sources('a b /dest/'), ['a', 'b'])
+        self.assertEqual(get_sources('["a b", "c", "/dest/"]'), ['a b', 'c'])
+
+    def test_get_context_paths(self):
+        self.touch('requirements.txt')
+        self.touch('src/app.py')
+        self.touch('src/app.cfg')
+        self.write(
+            'FROM python\n'
+            'ADD requirements.txt /app/\n'
+            'COPY ["./src/", "/app/src/"]\n'
+            'ADD http://example.com/file.tar.gz /tmp/\n'
+            'COPY src/*.cfg /etc/\n')
+        self.assertEqual(get_context_paths(self.path), [
+            'Dockerfile', 'requirements.txt', 'src', 'src/app.cfg',
+        ])
+
+    def test_get_context_paths_falls_back_to_everything(self):
+        for instruction in ['ADD . /app', 'COPY ../shared /app', 'ADD $SRC /app', 'COPY *.jar /app']:
+            self.write('FROM java\n%s\n' % instruction)
+            self.assertIsNone(get_context_paths(self.path), instruction)
+        os.remove(os.path.join(self.path, 'Dockerfile'))
+        self.assertIsNone(get_context_paths(self.path))
@@ -0,0 +1,93 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from .. import unittest
+
+import mock
+import docker
+
+from fig.dry_run import DryRunClient
+from fig.project import Project
+from fig.snapshot import ContainerSnapshot
+
+
+IMAGES = [{'Id': 'a' * 64, 'RepoTags': ['busybox:latest']}]
+
+
+class DryRunClientTest(unittest.TestCase):
+
+    def get_project(self, client):
+        return Project.from_dicts('figtest', [
+            {'name': 'web', 'image': 'busybox', 'links': ['db']},
+            {'name': 'db', 'image': 'busybox'},
+            {'name': 'app', 'build': '/path/to/app'},
+        ], ContainerSnapshot(client))
+
+    def test_up_from_nothing(self):
+        client = DryRunClient(containers=[], images=IMAGES)
+        self.get_project(client).up(parallel=1)
+
+        self.assertEqual(client.actions, [
+            ('build', 'figtest_app', '/path/to/app'),
+            ('create', 'figtest_db_1', 'busybox:latest'),
+            ('start', 'figtest_db_1', None),
+            ('create', 'figtest_web_1', 'busybox:latest'),
+            ('start', 'figtest_web_1', None),
+            ('create', 'figtest_app_1', 'figtest_app'),
+            ('start', 'figtest_app_1', None),
+        ])
+        self.assertEqual(client.calls['containers'], 1)
+        self.assertEqual(client.calls['images'], 1)
+
+    def test_second_up_leaves_containers_alone(self):
+        client = DryRunClient(containers=[], images=IMAGES)
+        self.get_project(client).up(parallel=1)
+        del client.actions[:]
+
+        self.get_project(client).up(parallel=1)
+        self.assertEqual(client.actions, [])
+
+    def test_ps_lists_containers_once(self):
+        client = DryRunClient(containers=[], images=IMAGES, api_version='1.21')
+        project = self.get_project(client)
+        project.containers(stopped=True)
+        project.containers(one_off=True)
+        self.assertEqual(client.calls, {'containers': 1, 'version': 1})
+
+    def test_pulls_missing_images(self):
+        client = DryRunClient(containers=[], images=[])
+        Project.from_dicts('figtest', [
+            {'name': 'db', 'image': 'redis'},
+        ], ContainerSnapshot(client)).up()
+        self.assertEqual([a[0] for a in client.actions], ['pull', 'create', 'start'])
+
+    def test_seeded_from_daemon(self):
+        daemon = mock.create_autospec(docker.Client)
+        daemon.containers.return_value = [
+            {'Id': 'b' * 64, 'Image': 'busybox', 'Names': ['/figtest_db_1'], 'Status': 'Up 2 hours'},
+            {'Id': 'c' * 64, 'Image': 'busybox', 'Names': ['/figtest_web_1', '/figtest_web_2'], 'Status': 'Up 2 hours'},
+        ]
+        daemon.images.return_value = IMAGES
+        daemon.version.return_value = {'ApiVersion': '1.14'}
+        client = DryRunClient(daemon)
+
+        self.get_project(client).stop()
+
+        self.assertEqual(client.actions, [
+            ('stop', 'figtest_web_1', None),
+            ('stop', 'figtest_db_1', None),
+        ])
+        daemon.containers.assert_called_once_with(all=True, trunc=False)
+        self.assertFalse(daemon.stop.called)
+
+    def test_format_plan(self):
+        client = DryRunClient(containers=[], images=IMAGES)
+        client.create_container('busybox', name='figtest_db_1')
+        self.assertEqual(
+            client.format_plan(),
+            'Actions:\n'
+            '    create figtest_db_1 (busybox)\n'
+            'API calls: 1 (create_container=1)')
+
+    def test_missing_container(self):
+        client = DryRunClient(containers=[], images=IMAGES)
+        self.assertRaises(docker.errors.APIError, client.start, 'abc')
@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+
+from .. import unittest
+
+import mock
+import docker
+
+from fig.container import Container
+from fig.events import ContainerMonitor, ContainerState
+from fig.snapshot import ContainerSnapshot
+
+
+def make_container(client, id, name, status='Up 3 seconds'):
+    return Container.from_ps(client, {
+        'Id': id,
+        'Image': 'busybox',
+        'Names': ['/' + name],
+        'Status': status,
+    })
+
+
+class ContainerMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.web = make_container(self.mock_client, 'abc', 'figtest_web_1')
+        self.db = make_container(self.mock_client, 'def', 'figtest_db_1', 'Exited (0) 1 second ago')
+
+    def run_events(self, monitor, events):
+        self.mock_client.events.return_value = [json.dumps(e) for e in events]
+        monitor.run()
+
+    def test_initial_state(self):
+        monitor = ContainerMonitor(self.mock_client, [self.web, self.db])
+        self.assertEqual(monitor.state(self.web), ContainerState(True, None, 0))
+        self.assertEqual(monitor.state(self.db), ContainerState(False, None, 0))
+
+    def test_die_and_restart(self):
+        self.mock_client.inspect_container.return_value = {'State': {'ExitCode': 2}}
+        monitor = ContainerMonitor(self.mock_client, [self.web, self.db])
+        seen = []
+        monitor.subscribe(lambda name, state: seen.append((name, state)))
+
+        self.run_events(monitor, [
+            {'status': 'die', 'id': 'abc', 'from': 'busybox:latest'},
+            {'status': 'start', 'id': 'abc', 'from': 'busybox:latest'},
+            {'status': 'die', 'id': 'zzz', 'from': 'busybox:latest'},
+            {'status': 'die', 'id': 'abc', 'from': 'busybox:latest',
+             'Actor': {'Attributes': {'exitCode': '137'}}},
+        ])
+
+        self.assertEqual(monitor.state(self.web), ContainerState(False, 137, 1))
+        self.assertEqual(seen, [
+            ('figtest_web_1', ContainerState(False, 2, 0)),
+            ('figtest_web_1', ContainerState(True, None, 1)),
+            ('figtest_web_1', ContainerState(False, 137, 1)),
+        ])
+        self.mock_client.inspect_container.assert_called_once_with('abc')
+
+    def test_tracks_new_project_containers_by_name(self):
+        monitor = ContainerMonitor(self.mock_client, [], project='figtest')
+        self.run_events(monitor, [
+            {'status': 'start', 'id': 'ghi', 'Actor': {'Attributes': {'name': 'figtest_web_2'}}},
+            {'status': 'start', 'id': 'jkl', 'Actor': {'Attributes': {'name': 'other_web_1'}}},
+        ])
+        self.assertEqual(monitor.names, {'ghi': 'figtest_web_2'})
+
+    def test_wait(self):
+        monitor = ContainerMonitor(self.mock_client, [self.web])
+        monitor.following = True
+        monitor.handle_event({'status': 'die', 'id': 'abc', 'Actor': {'Attributes': {'exitCode': '3'}}})
+        self.assertEqual(monitor.wait(self.web), 3)
+        self.assertFalse(self.mock_client.wait.called)
+
+    def test_wait_falls_back_to_daemon(self):
+        self.mock_client.wait.return_value = 4
+        monitor = ContainerMonitor(self.mock_client, [self.web])
+        self.assertEqual(monitor.wait(self.web), 4)
+
+        monitor.following = True
+        self.assertEqual(monitor.wait(self.web, timeout=0.1), 4)
+        self.assertEqual(self.mock_client.wait.call_count, 2)
+
+    def test_wait_wakes_when_event_stream_ends(self):
+        self.mock_client.wait.return_value = 5
+        monitor = ContainerMonitor(self.mock_client, [self.web])
+        monitor.following = True
+        self.run_events(monitor, [])
+        self.assertTrue(monitor.exited['abc'].is_set())
+        self.assertEqual(monitor.wait(self.web), 5)
+        self.mock_client.wait.assert_called_once_with('abc')
+
+    def test_updates_snapshot(self):
+        self.mock_client.containers.return_value = [
+            {'Id': 'abc', 'Image': 'busybox', 'Names': ['/figtest_web_1'], 'Status': 'Up 3 seconds'},
+        ]
+        snapshot = ContainerSnapshot(self.mock_client)
+        web = Container.from_ps(snapshot, snapshot.containers()[0])
+        monitor = ContainerMonitor(snapshot, [web])
+
+        monitor.handle_event({'status': 'die', 'id': 'abc', 'Actor': {'Attributes': {'exitCode': '1'}}})
+        self.assertFalse(web.is_running)
+        self.assertEqual(web.human_readable_state, 'Exit 1')
+        self.assertEqual(snapshot.containers(), [])
+        self.assertFalse(self.mock_client.inspect_container.called)
@@ -3,6 +3,7 @@ from __future__ import absolute_import
 import os
 
 from fig.cli.log_printer import LogPrinter
+from fig.events import ContainerState
 from .. import unittest
 
 
@@ -40,11 +41,24 @@ class LogPrinterTest(unittest.TestCase):
 
         self.assertIn(glyph, output)
 
+    def test_reports_exit_when_monitor_sees_container_die(self):
+        monitor = MockMonitor(exit_code=3)
 
-def run_log_printer(containers, monochrome=False):
+        def reader(*args, **kwargs):
+            yield b'hello\n'
+            monitor.die('myapp_web_1')
+            yield b'world\n'
+
+        output = run_log_printer([MockContainer(reader)], monochrome=True, monitor=monitor)
+
+        self.assertEqual(output.count('myapp_web_1 exited with code 3'), 1)
+        self.assertLess(output.index('exited with code'), output.index('world'))
+
+
+def run_log_printer(containers, monochrome=False, monitor=None):
     r, w = os.pipe()
     reader, writer = os.fdopen(r, 'r'), os.fdopen(w, 'w')
-    printer = LogPrinter(containers, output=writer, monochrome=monochrome)
+    printer = LogPrinter(containers, output=writer, monochrome=monochrome, monitor=monitor)
     printer.run()
     writer.close()
     return reader.read()
@@ -67,3 +81,19 @@ class MockContainer(object):
 
     def wait(self, *args, **kwargs):
         return 0
+
+
+class MockMonitor(object):
+    def __init__(self, exit_code):
+        self.exit_code = exit_code
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def die(self, name):
+        for callback in self.subscribers:
+            callback(name, ContainerState(False, self.exit_code, 0))
+
+    def wait(self, container, timeout=None):
+        return self.exit_code
@@ -0,0 +1,158 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from threading import Lock
+import time
+
+from .. import unittest
+
+from fig.parallel import dependency_layers, parallel_execute, parallel_execute_graph
+
+
+class ParallelExecuteTest(unittest.TestCase):
+
+    def test_results_are_in_order(self):
+        def func(n):
+            time.sleep(0.01 * (5 - n))
+            return n * 2
+
+        self.assertEqual(parallel_execute(range(5), func), [0, 2, 4, 6, 8])
+
+    def test_limit(self):
+        lock = Lock()
+        state = {'running': 0, 'max': 0}
+
+        def func(n):
+            with lock:
+                state['running'] += 1
+                state['max'] = max(state['max'], state['running'])
+            time.sleep(0.02)
+            with lock:
+                state['running'] -= 1
+
+        parallel_execute(range(10), func, limit=3)
+        self.assertEqual(state['max'], 3)
+
+    def test_first_error_is_raised_after_all_calls_finish(self):
+        finished = []
+
+        def func(n):
+            if n in (1, 3):
+                raise ValueError(n)
+            time.sleep(0.02)
+            finished.append(n)
+
+        with self.assertRaises(ValueError) as cm:
+            parallel_execute(range(5), func, limit=5)
+        self.assertEqual(cm.exception.args, (1,))
+        self.assertEqual(sorted(finished), [0, 2, 4])
+
+    def test_empty(self):
+        self.assertEqual(parallel_execute([], lambda n: n), [])
+
+
+class ParallelExecuteGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dependencies = {
+            'db': [],
+            'cache': [],
+            'web': ['db', 'cache'],
+            'proxy': ['web'],
+        }
+
+    def get_dependencies(self, name):
+        return self.dependencies[name]
+
+    def test_dependencies_finish_first(self):
+        lock = Lock()
+        finished = []
+
+        def func(name):
+            time.sleep(0.01)
+            for dep in self.dependencies[name]:
+                self.assertIn(dep, finished)
+            with lock:
+                finished.append(name)
+            return name.upper()
+
+        results = parallel_execute_graph(
+            ['db', 'cache', 'web', 'proxy'], func, self.get_dependencies)
+        self.assertEqual(results, ['DB', 'CACHE', 'WEB', 'PROXY'])
+        self.assertEqual(finished[2:], ['web', 'proxy'])
+
+    def test_independent_objects_run_at_once(self):
+        lock = Lock()
+        state = {'running': 0, 'max': 0}
+
+        def func(name):
+            with lock:
+                state['running'] += 1
+                state['max'] = max(state['max'], state['running'])
+            time.sleep(0.02)
+            with lock:
+                state['running'] -= 1
+
+        parallel_execute_graph(['db', 'cache', 'web'], func, self.get_dependencies)
+        self.assertEqual(state['max'], 2)
+
+    def test_limit_of_one_is_serial(self):
+        called = []
+        parallel_execute_graph(
+            ['proxy', 'web', 'db', 'cache'], called.append, self.get_dependencies, limit=1)
+        self.assertEqual(called, ['db', 'cache', 'web', 'proxy'])
+
+    def test_dependencies_outside_objects_are_ignored(self):
+        called = []
+        parallel_execute_graph(['web'], called.append, self.get_dependencies)
+        self.assertEqual(called, ['web'])
+
+    def test_dependents_of_a_failure_are_skipped(self):
+        called = []
+        errors = []
+
+        def func(name):
+            called.append(name)
+            if name in ('db', 'cache'):
+                time.sleep(0.02)
+                raise ValueError(name)
+
+        def on_error(name, error):
+            errors.append((name, error.args))
+
+        with self.assertRaises(ValueError) as cm:
+            parallel_execute_graph(
+                ['db', 'cache', 'web', 'proxy'], func, self.get_dependencies,
+                on_error=on_error)
+        self.assertEqual(cm.exception.args, ('db',))
+        self.assertEqual(errors, [('cache', ('cache',))])
+        self.assertEqual(sorted(called), ['cache', 'db'])
+
+    def test_circular_dependency(self):
+        self.dependencies['db'] = ['proxy']
+        with self.assertRaises(ValueError):
+            parallel_execute_graph(
+                ['db', 'web', 'proxy'], lambda name: None, self.get_dependencies)
+
+
+class DependencyLayersTest(unittest.TestCase):
+
+    def test_layers(self):
+        dependencies = {
+            'proxy': ['web'],
+            'web': ['db', 'cache'],
+            'worker': ['db'],
+            'db': [],
+            'cache': [],
+        }
+        self.assertEqual(
+            dependency_layers(['proxy', 'web', 'worker', 'db', 'cache'], dependencies.get),
+            [['db', 'cache'], ['web', 'worker'], ['proxy']])
+
+    def test_dependencies_outside_objects_are_ignored(self):
+        self.assertEqual(
+            dependency_layers(['web', 'worker'], {'web': ['db'], 'worker': ['web']}.get),
+            [['web'], ['worker']])
+
+    def test_circular_dependency(self):
+        with self.assertRaises(ValueError):
+            dependency_layers(['web', 'db'], {'web': ['db'], 'db': ['web']}.get)
@@ -1,11 +1,19 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
 from tests import unittest
+import io
+import json
+import os
+import shutil
+import tempfile
 
+import docker
 import mock
+import six
 from six import StringIO
 
 from fig import progress_stream 
+from fig.service import Service
 
 
 class ProgressStreamTestCase(unittest.TestCase):
@@ -16,5 +24,222 @@ class ProgressStreamTestCase(unittest.TestCase):
             '31019763, "start": 1413653874, "total": 62763875}, '
             '"progress": "..."}',
         ]
-        events = progress_stream.stream_output(output, StringIO())
+        events = []
+        progress_stream.stream_output(output, StringIO(), [events.append])
         self.assertEqual(len(events), 1)
+
+    def test_stream_output_raises_errors(self):
+        output = [
+            '{"stream": "Step 0 : FROM busybox\\n"}',
+            '{"errorDetail": {"message": "oops"}, "error": "oops"}',
+            '{"stream": "never read"}',
+        ]
+        events = []
+        with self.assertRaises(progress_stream.StreamOutputError):
+            progress_stream.stream_output(output, StringIO(), [events.append])
+        self.assertEqual(len(events), 2)
+
+    def test_build_image_id(self):
+        build_image_id = progress_stream.BuildImageId()
+        progress_stream.stream_output([
+            '{"stream": "Step 0 : FROM busybox\\n"}',
+            '{"stream": "Successfully built 7e2a0b3f1c4d\\n"}',
+        ], StringIO(), [build_image_id])
+        self.assertEqual(build_image_id.image_id, '7e2a0b3f1c4d')
+
+    def test_stream_output_not_a_terminal_writes_layer_transitions(self):
+        output = StringIO()
+        progress_stream.stream_output([
+            '{"status": "Pulling repository busybox"}',
+            '{"status": "Pulling fs layer", "id": "abc", "progressDetail": {}}',
+            '{"status": "Downloading", "id": "abc", "progress": "[>  ]", "progressDetail": {"current": 1, "total": 3}}',
+            '{"status": "Downloading", "id": "abc", "progress": "[=> ]", "progressDetail": {"current": 2, "total": 3}}',
+            '{"status": "Download complete", "id": "abc", "progressDetail": {}}',
+        ], output)
+        self.assertEqual(
+            output.getvalue(),
+            'Pulling repository busybox\n'
+            'abc: Pulling fs layer\n'
+            'abc: Downloading\n'
+            'abc: Download complete\n')
+
+    def test_terminal_renderer_draws_latest_state_per_frame(self):
+        now = [0.0]
+        output = StringIO()
+        renderer = progress_stream.TerminalRenderer(output, clock=lambda: now[0])
+        renderer.is_terminal = True
+        for current in range(1, 100):
+            now[0] += 0.001
+            renderer({'status': 'Downloading', 'id': 'abc', 'progressDetail': {'current': current, 'total': 100}})
+        renderer.finish()
+        self.assertEqual(
+            output.getvalue(),
+            '\n\x1b[1A\x1b[2K\rabc: Downloading (1.0%)\r\x1b[1B'
+            '\x1b[1A\x1b[2K\rabc: Downloading (99.0%)\r\x1b[1B')
+
+    def test_json_stream_splits_chunks(self):
+        output = [b'{"stream": "one"}\r\n{"stream": "two"}', b'\n{"stream": "three"}']
+        self.assertEqual(
+            [event['stream'] for event in progress_stream.json_stream(output)],
+            ['one', 'two', 'three'])
+
+    def test_json_stream_joins_chunks(self):
+        document = '{"stream": "caf\u00e9 {\\"nested\\": 1}"}'.encode('utf-8')
+        output = [document[i:i + 3] for i in range(0, len(document), 3)]
+        self.assertEqual(
+            list(progress_stream.json_stream(output)),
+            [{'stream': 'caf\u00e9 {"nested": 1}'}])
+
+    def test_json_stream_is_lazy(self):
+        def output():
+            yield b'{"stream": "one"}'
+            raise AssertionError('read too far')
+        self.assertEqual(next(progress_stream.json_stream(output())), {'stream': 'one'})
+
+    def test_json_stream_with_truncated_document(self):
+        stream = progress_stream.json_stream([b'{"stream": "one"}{"stream": '])
+        self.assertEqual(next(stream), {'stream': 'one'})
+        self.assertRaises(progress_stream.StreamOutputError, next, stream)
+
+
+class ProgressLogTestCase(unittest.TestCase):
+
+    def test_writes_normalised_events(self):
+        output = StringIO()
+        progress_log = progress_stream.ProgressLog(output, clock=lambda: 1420070400.5)
+        progress_stream.stream_events([
+            '{"stream": "Step 0 : FROM busybox\\n"}',
+            '{"stream": "\\n"}',
+            '{"errorDetail": {"message": "oops"}, "error": "oops"}',
+        ], [progress_log.consumer('web')])
+        self.assertEqual(
+            output.getvalue(),
+            '{"service":"web","stream":"Step 0 : FROM busybox","time":"2015-01-01T00:00:00.500000Z"}\n'
+            '{"error":"oops","service":"web","time":"2015-01-01T00:00:00.500000Z"}\n')
+
+    def test_coalesces_layer_progress(self):
+        now = [0.0]
+        output = StringIO()
+        progress_log = progress_stream.ProgressLog(output, clock=lambda: now[0])
+        for current in range(1, 31):
+            now[0] += 0.125
+            progress_log.write('db', {
+                'status': 'Downloading', 'id': 'abc', 'progress': '[=>  ]',
+                'progressDetail': {'current': current, 'total': 30},
+            })
+        progress_log.write('web', {'status': 'Downloading', 'id': 'abc', 'progressDetail': {'current': 1, 'total': 2}})
+        progress_log.write('db', {'status': 'Download complete', 'id': 'abc', 'progressDetail': {}})
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(
+            [(r['service'], r['status'], r.get('progress', {}).get('current')) for r in records],
+            [('db', 'Downloading', 1), ('db', 'Downloading', 9), ('db', 'Downloading', 17), ('db', 'Downloading', 25),
+             ('web', 'Downloading', 1), ('db', 'Download complete', None)])
+
+
+    def test_service_build_writes_progress_log(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        with open(os.path.join(path, 'Dockerfile'), 'w') as f:
+            f.write('FROM busybox\n')
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.build.return_value = iter([
+            json.dumps({'stream': 'Successfully built abc123\n'}),
+        ])
+        output = io.StringIO() if six.PY3 else io.BytesIO()
+        service = Service(
+            'web', client=mock_client, project='figtest', build=path,
+            progress_log=progress_stream.ProgressLog(output))
+        with mock.patch('sys.stdout') as mock_stdout:
+            self.assertEqual(service.build(), 'abc123')
+        self.assertFalse(mock_stdout.write.called)
+        record = json.loads(output.getvalue())
+        self.assertEqual(record['service'], 'web')
+        self.assertEqual(record['stream'], 'Successfully built abc123')
+
+
+class ProgressBoardTestCase(unittest.TestCase):
+
+    def test_not_a_terminal_writes_status_changes(self):
+        output = StringIO()
+        board = progress_stream.ProgressBoard(output)
+        board.update('busybox', 'Downloading', '[=>  ]')
+        board.update('redis', 'Downloading', '[=>  ]')
+        board.update('busybox', 'Downloading', '[==> ]')
+        board.update('busybox', 'Download complete')
+        self.assertEqual(
+            output.getvalue(),
+            'busybox: Downloading\n'
+            'redis: Downloading\n'
+            'busybox: Download complete\n')
+
+    def test_not_a_terminal_writes_status_changes_per_layer(self):
+        output = StringIO()
+        board = progress_stream.ProgressBoard(output)
+        board.update('busybox', 'Downloading', '[=>  ]', layer='abc')
+        board.update('busybox', 'Downloading', '[=>  ]', layer='def')
+        board.update('busybox', 'Downloading', '[==> ]', layer='abc')
+        board.update('busybox', 'Downloading', '[==> ]', layer='def')
+        board.update('busybox', 'Download complete', layer='abc')
+        self.assertEqual(
+            output.getvalue(),
+            'busybox: abc: Downloading\n'
+            'busybox: def: Downloading\n'
+            'busybox: abc: Download complete\n')
+
+    def test_terminal_updates_lines_in_place(self):
+        output = StringIO()
+        board = progress_stream.ProgressBoard(output, interval=0)
+        board.is_terminal = True
+        board.update('busybox', 'Downloading')
+        board.update('redis', 'Downloading')
+        board.update('busybox', 'Done')
+        self.assertEqual(
+            output.getvalue(),
+            '\n\x1b[1A\x1b[2K\rbusybox: Downloading\r\x1b[1B'
+            '\n\x1b[1A\x1b[2K\rredis: Downloading\r\x1b[1B'
+            '\x1b[2A\x1b[2K\rbusybox: Done\r\x1b[2B')
+
+    def test_terminal_redraws_at_most_once_per_frame(self):
+        now = [0.0]
+        output = StringIO()
+        board = progress_stream.ProgressBoard(output, clock=lambda: now[0])
+        board.is_terminal = True
+        board.update('busybox', 'Downloading', '[>   ]')
+        for progress in ['[=>  ]', '[==> ]', '[===>]']:
+            now[0] += 0.01
+            board.update('busybox', 'Downloading', progress)
+        self.assertEqual(output.getvalue().count('\x1b[2K'), 1)
+
+        now[0] += 0.1
+        board.update('busybox', 'Download complete')
+        self.assertEqual(output.getvalue().count('\x1b[2K'), 2)
+        self.assertNotIn('[===>]', output.getvalue())
+
+        board.update('busybox', 'Pull complete')
+        board.finish()
+        self.assertTrue(output.getvalue().endswith('\x1b[2K\rbusybox: Pull complete\r\x1b[1B'))
+
+    def test_stream_progress_raises_errors(self):
+        board = mock.Mock()
+        output = ['{"errorDetail": {"message": "not found"}, "error": "not found"}']
+        with self.assertRaises(progress_stream.StreamOutputError):
+            progress_stream.stream_progress(output, board, 'busybox')
+        board.update.assert_called_once_with('busybox', 'Error')
+
+
+class PrefixedStreamTestCase(unittest.TestCase):
+
+    def test_prefixes_complete_lines(self):
+        output = StringIO()
+        stream = progress_stream.PrefixedStream(output, 'web | ', mock.MagicMock())
+        stream.write('Step 0 : FROM busybox\nStep 1 ')
+        self.assertEqual(output.getvalue(), 'web | Step 0 : FROM busybox\n')
+        stream.write(': RUN true\n')
+        stream.write('Successfully built 123')
+        stream.finish()
+        self.assertEqual(
+            output.getvalue(),
+            'web | Step 0 : FROM busybox\n'
+            'web | Step 1 : RUN true\n'
+            'web | Successfully built 123\n')
@@ -1,5 +1,11 @@
 from __future__ import unicode_literals
+import time
+
 from .. import unittest
+
+import mock
+import docker
+
 from fig.service import Service
 from fig.project import Project, ConfigurationError
 
@@ -139,3 +145,162 @@ class ProjectTest(unittest.TestCase):
             project.get_services(['web', 'db'], include_links=True),
             [db, web]
         )
+
+    def test_containers(self):
+        client = mock.create_autospec(docker.Client)
+        client.containers.return_value = [
+            {'Id': 'a', 'Image': 'busybox', 'Names': ['/figtest_web_1']},
+            {'Id': 'b', 'Image': 'busybox', 'Names': ['/figtest_db_1']},
+            {'Id': 'c', 'Image': 'busybox', 'Names': ['/figtest_db_run_1']},
+            {'Id': 'd', 'Image': 'busybox', 'Names': ['/figtest_cache_1']},
+            {'Id': 'e', 'Image': 'busybox', 'Names': ['/other_web_1']},
+        ]
+        project = Project.from_dicts('figtest', [
+            {'name': 'web', 'image': 'busybox:latest'},
+            {'name': 'db', 'image': 'busybox:latest'},
+        ], client)
+
+        self.assertEqual(
+            sorted(c.id for c in project.containers(stopped=True)),
+            ['a', 'b'])
+        self.assertEqual(
+            [c.id for c in project.containers(service_names=['db'], one_off=True)],
+            ['c'])
+        client.containers.assert_called_with(all=False, trunc=False)
+
+    def test_up_starts_dependencies_first(self):
+        project = Project.from_dicts('figtest', [
+            {'name': 'web', 'image': 'busybox:latest', 'links': ['db', 'cache']},
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'cache', 'image': 'busybox:latest'},
+        ], None)
+        started = []
+
+        def recreate_containers(service):
+            for dep in service.get_dependencies():
+                self.assertIn(dep.name, started)
+            started.append(service.name)
+            return [(None, service.name + '_1')]
+
+        with mock.patch.object(Service, 'recreate_containers', autospec=True) as mock_recreate:
+            mock_recreate.side_effect = lambda service, **kwargs: recreate_containers(service)
+            containers = project.up()
+
+        self.assertEqual(sorted(started), ['cache', 'db', 'web'])
+        self.assertEqual(started[-1], 'web')
+        self.assertEqual(sorted(containers), ['cache_1', 'db_1', 'web_1'])
+
+    def test_up_does_not_start_dependents_of_a_failed_service(self):
+        project = Project.from_dicts('figtest', [
+            {'name': 'web', 'image': 'busybox:latest', 'links': ['db']},
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'cache', 'image': 'busybox:latest'},
+        ], None)
+        started = []
+
+        def start_or_create_containers(service, **kwargs):
+            if service.name == 'db':
+                raise ValueError('db failed')
+            started.append(service.name)
+            return []
+
+        with mock.patch.object(Service, 'start_or_create_containers', autospec=True) as mock_start:
+            mock_start.side_effect = start_or_create_containers
+            self.assertRaises(ValueError, project.up, recreate=False)
+
+        self.assertEqual(started, ['cache'])
+
+    def test_stop_stops_dependents_first(self):
+        client = mock.create_autospec(docker.Client)
+        client.containers.return_value = [
+            {'Id': 'a', 'Image': 'busybox', 'Names': ['/figtest_web_1'], 'Status': 'Up 1 second'},
+            {'Id': 'b', 'Image': 'busybox', 'Names': ['/figtest_db_1'], 'Status': 'Up 1 second'},
+            {'Id': 'c', 'Image': 'busybox', 'Names': ['/figtest_web_2'], 'Status': 'Up 1 second'},
+        ]
+        project = Project.from_dicts('figtest', [
+            {'name': 'web', 'image': 'busybox:latest', 'links': ['db']},
+            {'name': 'db', 'image': 'busybox:latest'},
+        ], client)
+        project.stop(timeout=1)
+
+        stopped = [call[0][0] for call in client.stop.call_args_list]
+        self.assertEqual(sorted(stopped[:2]), ['a', 'c'])
+        self.assertEqual(stopped[2], 'b')
+        client.stop.assert_called_with('b', timeout=1)
+
+    @mock.patch('fig.project.ProgressBoard', autospec=True)
+    def test_pull_pulls_each_image_once(self, mock_board):
+        project = Project.from_dicts('figtest', [
+            {'name': 'web', 'image': 'busybox'},
+            {'name': 'worker', 'image': 'busybox:latest'},
+            {'name': 'db', 'image': 'redis'},
+            {'name': 'app', 'build': '.'},
+        ], None)
+        pulled = []
+
+        with mock.patch.object(Service, 'pull', autospec=True) as mock_pull:
+            mock_pull.side_effect = lambda service, **kwargs: pulled.append(service.name)
+            project.pull()
+
+        self.assertEqual(sorted(pulled), ['db', 'web'])
+
+    def test_build_builds_base_images_first(self):
+        project = Project.from_dicts('figtest', [
+            {'name': 'base', 'build': '/base'},
+            {'name': 'web', 'build': '/web'},
+            {'name': 'worker', 'build': '/worker'},
+            {'name': 'db', 'image': 'busybox:latest'},
+        ], None)
+        base_images = {'/base': 'ubuntu', '/web': 'figtest_base', '/worker': 'figtest_base:latest'}
+        built = []
+
+        def build(service, no_cache=False, stream=None, compress_level=None, minimal_context=False, shared_with=None):
+            time.sleep(0.01)
+            if service.name != 'base':
+                self.assertIn('base', built)
+            built.append(service.name)
+
+        with mock.patch('fig.service.get_base_image', side_effect=base_images.get):
+            with mock.patch.object(Service, 'build', autospec=True) as mock_build:
+                mock_build.side_effect = build
+                project.build()
+
+        self.assertEqual(built[0], 'base')
+        self.assertEqual(sorted(built), ['base', 'web', 'worker'])
+
+    def test_build_shared_build_directory_once(self):
+        project = Project.from_dicts('figtest', [
+            {'name': 'web', 'build': '/app'},
+            {'name': 'worker', 'build': '/app'},
+            {'name': 'db', 'build': '/db'},
+        ], None)
+        built = {}
+
+        def build(service, shared_with=None, **options):
+            built[service.name] = [s.name for s in shared_with]
+
+        with mock.patch('fig.service.get_base_image', return_value=None):
+            with mock.patch.object(Service, 'build', autospec=True) as mock_build:
+                mock_build.side_effect = build
+                project.build()
+
+        self.assertEqual(built, {'web': ['worker'], 'db': []})
+
+    def test_up_builds_shared_build_directory_once(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.containers.return_value = []
+        mock_client.images.return_value = []
+        project = Project.from_dicts('figtest', [
+            {'name': 'web', 'build': '/app'},
+            {'name': 'worker', 'build': '/app'},
+        ], mock_client)
+
+        with mock.patch('fig.service.get_base_image', return_value=None):
+            with mock.patch.object(Service, 'build', autospec=True) as mock_build:
+                with mock.patch.object(Service, 'recreate_containers', autospec=True) as mock_recreate:
+                    mock_recreate.return_value = []
+                    project.up()
+
+        self.assertEqual(mock_build.call_count, 1)
+        self.assertEqual(mock_build.call_args[1]['shared_with'], [project.get_service('worker')])
+
@@ -1,6 +1,10 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
+import json
 import os
+import shutil
+import tempfile
+import time
 
 from .. import unittest
 import mock
@@ -9,7 +13,9 @@ import docker
 from requests import Response
 
 from fig import Service
+from fig.build_cache import BuildCache
 from fig.container import Container
+from fig.snapshot import ContainerSnapshot
 from fig.service import (
     ConfigError,
     split_port,
@@ -18,6 +24,10 @@ from fig.service import (
     build_volume_binding,
     APIError,
     parse_repository_tag,
+    ContainerIndex,
+    ServiceName,
+    NumberAllocator,
+    get_container_volumes,
 )
 
 
@@ -165,6 +175,19 @@ class ServiceTest(unittest.TestCase):
         self.assertEqual(opts['hostname'], 'name.sub', 'hostname')
         self.assertEqual(opts['domainname'], 'domain.tld', 'domainname')
 
+    def test_containers(self):
+        self.mock_client.containers.return_value = [
+            {'Id': 'a', 'Image': 'busybox', 'Names': ['/default_foo_1']},
+            {'Id': 'b', 'Image': 'busybox', 'Names': ['/default_foo_run_1']},
+            {'Id': 'c', 'Image': 'busybox', 'Names': ['/default_bar_1']},
+            {'Id': 'd', 'Image': 'busybox', 'Names': ['/other_foo_1']},
+        ]
+        service = Service('foo', client=self.mock_client)
+
+        self.assertEqual([c.id for c in service.containers(stopped=True)], ['a'])
+        self.assertEqual([c.id for c in service.containers(one_off=True)], ['b'])
+        self.mock_client.containers.assert_called_with(all=False, trunc=False)
+
     def test_get_container_not_found(self):
         self.mock_client.containers.return_value = []
         service = Service('foo', client=self.mock_client)
@@ -182,12 +205,35 @@ class ServiceTest(unittest.TestCase):
         mock_container_class.from_ps.assert_called_once_with(
             self.mock_client, container_dict)
 
+    @mock.patch('fig.service.Container', autospec=True)
+    def test_get_container_number_as_string(self, mock_container_class):
+        self.mock_client.containers.return_value = [dict(Name='default_foo_2')]
+        service = Service('foo', client=self.mock_client)
+
+        service.get_container(number='2')
+        self.assertEqual(mock_container_class.from_ps.call_count, 1)
+
+    @mock.patch('fig.service.stream_output', autospec=True)
     @mock.patch('fig.service.log', autospec=True)
-    def test_pull_image(self, mock_log):
+    def test_pull_image(self, mock_log, mock_stream_output):
         service = Service('foo', client=self.mock_client, image='someimage:sometag')
         service.pull(insecure_registry=True)
-        self.mock_client.pull.assert_called_once_with('someimage:sometag', insecure_registry=True)
+        self.mock_client.pull.assert_called_once_with('someimage:sometag', insecure_registry=True, stream=True)
         mock_log.info.assert_called_once_with('Pulling foo (someimage:sometag)...')
+        self.assertEqual(mock_stream_output.call_count, 1)
+
+    def test_pull_image_with_board(self):
+        self.mock_client.pull.return_value = [
+            '{"status": "Pulling fs layer", "id": "abc"}',
+            '{"status": "Downloading", "id": "abc", "progress": "[==> ]"}',
+        ]
+        board = mock.Mock()
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.pull(board=board)
+        self.assertEqual(board.update.call_args_list, [
+            mock.call('someimage:latest', 'Pulling fs layer', None, layer='abc'),
+            mock.call('someimage:latest', 'Downloading', '[==> ]', layer='abc'),
+        ])
 
     @mock.patch('fig.service.log', autospec=True)
     def test_create_container_from_insecure_registry(self, mock_log):
@@ -204,6 +250,278 @@ class ServiceTest(unittest.TestCase):
         self.mock_client.pull.assert_called_once_with('someimage:sometag', insecure_registry=True, stream=True)
         mock_log.info.assert_called_once_with('Pulling image someimage:sometag...')
 
+    @mock.patch.object(Container, 'create')
+    def test_create_container_lists_containers_once(self, mock_create):
+        self.mock_client.containers.return_value = [
+            {'Id': 'a', 'Image': 'busybox', 'Names': ['/default_foo_2']},
+        ]
+        service = Service('foo', client=self.mock_client, image='busybox')
+
+        for _ in range(3):
+            service.create_container()
+
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+        self.assertEqual(
+            [call[1]['name'] for call in mock_create.call_args_list],
+            ['default_foo_3', 'default_foo_4', 'default_foo_5'])
+
+    @mock.patch.object(Container, 'create')
+    def test_create_container_pulls_image_missing_from_catalogue(self, mock_create):
+        self.mock_client.containers.return_value = []
+        self.mock_client.images.return_value = []
+        self.mock_client.version.return_value = {'ApiVersion': '1.14'}
+        service = Service('foo', client=ContainerSnapshot(self.mock_client), image='someimage:sometag')
+
+        with mock.patch('fig.service.stream_output'):
+            service.create_container()
+            service.create_container()
+
+        self.mock_client.pull.assert_called_once_with('someimage:sometag', insecure_registry=False, stream=True)
+        self.mock_client.images.assert_called_once_with()
+        self.assertEqual(mock_create.call_count, 2)
+
+    @mock.patch.object(Container, 'create')
+    def test_create_container_builds_image_missing_from_catalogue(self, mock_create):
+        self.mock_client.containers.return_value = []
+        self.mock_client.images.return_value = []
+        self.mock_client.version.return_value = {'ApiVersion': '1.14'}
+        service = Service('foo', client=ContainerSnapshot(self.mock_client), build='/path/to/foo')
+
+        with mock.patch.object(Service, 'build', autospec=True) as mock_build:
+            mock_build.side_effect = lambda service: service.client.image_catalogue().add('default_foo', 'abc')
+            for _ in range(3):
+                service.create_container()
+
+        self.assertEqual(mock_build.call_count, 1)
+        self.mock_client.images.assert_called_once_with()
+
+    @mock.patch.object(Container, 'create')
+    def test_scale_pulls_missing_image_once(self, mock_create):
+        self.mock_client.containers.return_value = []
+        self.mock_client.images.return_value = []
+        self.mock_client.version.return_value = {'ApiVersion': '1.14'}
+        self.mock_client.pull.side_effect = lambda *args, **kwargs: time.sleep(0.05) or []
+        service = Service('foo', client=ContainerSnapshot(self.mock_client), image='someimage:sometag')
+
+        with mock.patch('fig.service.stream_output'):
+            service.scale(5)
+
+        self.assertEqual(self.mock_client.pull.call_count, 1)
+        self.assertEqual(mock_create.call_count, 5)
+
+    @mock.patch.object(Container, 'create')
+    def test_scale_builds_missing_image_once(self, mock_create):
+        self.mock_client.containers.return_value = []
+        self.mock_client.images.return_value = []
+        self.mock_client.version.return_value = {'ApiVersion': '1.14'}
+        service = Service('foo', client=ContainerSnapshot(self.mock_client), build='/path/to/foo')
+
+        def build(service):
+            time.sleep(0.05)
+            service.client.image_catalogue().add('default_foo', 'abc')
+
+        with mock.patch.object(Service, 'build', autospec=True) as mock_build:
+            mock_build.side_effect = build
+            service.scale(5)
+
+        self.assertEqual(mock_build.call_count, 1)
+        self.assertEqual(mock_create.call_count, 5)
+
+    def test_scale_stops_highest_numbers(self):
+        self.mock_client.containers.return_value = [
+            {'Id': 'a', 'Image': 'busybox', 'Names': ['/default_foo_1'], 'Status': 'Up 1 second'},
+            {'Id': 'b', 'Image': 'busybox', 'Names': ['/default_foo_2'], 'Status': 'Up 1 second'},
+            {'Id': 'c', 'Image': 'busybox', 'Names': ['/default_foo_3'], 'Status': 'Up 1 second'},
+        ]
+        service = Service('foo', client=self.mock_client, image='busybox')
+        service.scale(1)
+
+        self.assertEqual(
+            sorted(call[0][0] for call in self.mock_client.stop.call_args_list),
+            ['b', 'c'])
+        self.assertFalse(self.mock_client.start.called)
+
+    def test_scale_starts_lowest_numbers(self):
+        self.mock_client.containers.return_value = [
+            {'Id': 'a', 'Image': 'busybox', 'Names': ['/default_foo_1'], 'Status': 'Up 1 second'},
+            {'Id': 'b', 'Image': 'busybox', 'Names': ['/default_foo_2'], 'Status': 'Exited (0) 1 second ago'},
+            {'Id': 'c', 'Image': 'busybox', 'Names': ['/default_foo_3'], 'Status': 'Exited (0) 1 second ago'},
+            {'Id': 'd', 'Image': 'busybox', 'Names': ['/default_foo_4'], 'Status': 'Exited (0) 1 second ago'},
+        ]
+        service = Service('foo', client=self.mock_client, image='busybox')
+        service.scale(3)
+
+        self.assertEqual(
+            sorted(call[0][0] for call in self.mock_client.start.call_args_list),
+            ['b', 'c'])
+        self.assertFalse(self.mock_client.stop.called)
+
+    def test_rolling_recreate_batches(self):
+        service = Service('foo', client=self.mock_client, image='busybox')
+        containers = [mock.Mock(spec=Container, number=n, name='default_foo_%d' % n) for n in (3, 1, 2, 4, 5)]
+        calls = []
+
+        with mock.patch.object(service, 'replace_container') as mock_replace:
+            with mock.patch.object(service, 'recreate_container') as mock_recreate:
+                mock_replace.side_effect = lambda c, **kwargs: calls.append(('replace', c.number)) or (None, c)
+                mock_recreate.side_effect = lambda c, **kwargs: calls.append(('recreate', c.number)) or (None, c)
+                tuples = service.rolling_recreate(containers, max_unavailable=1, max_surge=1)
+
+        self.assertEqual([c.number for (_, c) in tuples], [1, 2, 3, 4, 5])
+        self.assertEqual(sorted(calls[:2]), [('recreate', 2), ('replace', 1)])
+        self.assertEqual(sorted(calls[2:4]), [('recreate', 4), ('replace', 3)])
+        self.assertEqual(calls[4], ('replace', 5))
+
+    def test_rolling_recreate_without_surge_for_fixed_ports(self):
+        service = Service('foo', client=self.mock_client, image='busybox', ports=['8000:8000'])
+        containers = [mock.Mock(spec=Container, number=1, name='default_foo_1')]
+
+        with mock.patch.object(service, 'recreate_container') as mock_recreate:
+            service.rolling_recreate(containers, max_surge=1)
+        mock_recreate.assert_called_once_with(containers[0])
+
+    def test_rolling_recreate_needs_a_batch_size(self):
+        service = Service('foo', client=self.mock_client, image='busybox')
+        self.assertRaises(ValueError, service.rolling_recreate, [], max_unavailable=0, max_surge=0)
+
+    @mock.patch.object(Container, 'create')
+    def test_replace_container_starts_new_container_first(self, mock_create):
+        self.mock_client.containers.return_value = []
+        new_container = mock.Mock(spec=Container, id='new')
+        mock_create.return_value = new_container
+        old_container = mock.Mock(spec=Container, id='old', number=1)
+        service = Service('foo', client=self.mock_client, image='busybox')
+
+        manager = mock.Mock()
+        manager.attach_mock(new_container.start, 'start_new')
+        manager.attach_mock(old_container.stop, 'stop_old')
+        manager.attach_mock(old_container.remove, 'remove_old')
+
+        self.assertEqual(service.replace_container(old_container), (None, new_container))
+        self.assertEqual([c[0] for c in manager.mock_calls], ['start_new', 'stop_old', 'remove_old'])
+        self.assertEqual(new_container.start.call_args[1]['volumes_from'], ['old'])
+
+    @mock.patch.object(Container, 'create')
+    def test_recreate_container_binds_previous_volumes(self, mock_create):
+        self.mock_client.containers.return_value = []
+        new_container = mock.Mock(spec=Container, id='new')
+        mock_create.return_value = new_container
+        old_container = Container(self.mock_client, {
+            'Id': 'old',
+            'Name': '/default_foo_1',
+            'Volumes': {'/data': '/var/lib/docker/vfs/dir/abc', '/src': '/home/user/old-src'},
+            'VolumesRW': {'/data': True, '/src': True},
+        }, has_been_inspected=True)
+        service = Service('foo', client=self.mock_client, image='busybox', volumes=['/data', '/home/user/src:/src'])
+
+        self.assertEqual(service.recreate_container(old_container), (None, new_container))
+        self.mock_client.stop.assert_called_once_with('old')
+        self.mock_client.remove_container.assert_called_once_with('old')
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual(new_container.start.call_args[1]['binds'], {
+            '/var/lib/docker/vfs/dir/abc': {'bind': '/data', 'ro': False},
+            '/home/user/src': {'bind': '/src', 'ro': False},
+        })
+
+    def test_get_container_volumes(self):
+        container = Container(None, {
+            'Volumes': {'/data': '/var/lib/docker/vfs/dir/abc', '/etc/conf': '/home/user/conf'},
+            'VolumesRW': {'/data': True, '/etc/conf': False},
+        }, has_been_inspected=True)
+        self.assertEqual(get_container_volumes(container), {
+            '/data': ('/var/lib/docker/vfs/dir/abc', True),
+            '/etc/conf': ('/home/user/conf', False),
+        })
+
+    def test_get_container_volumes_from_mounts(self):
+        container = Container(None, {
+            'Mounts': [{'Source': '/var/lib/docker/volumes/abc/_data', 'Destination': '/data', 'RW': False}],
+        }, has_been_inspected=True)
+        self.assertEqual(get_container_volumes(container), {
+            '/data': ('/var/lib/docker/volumes/abc/_data', False),
+        })
+
+    def test_get_container_volumes_unknown(self):
+        container = Container(None, {'Id': 'abc'}, has_been_inspected=True)
+        self.assertEqual(get_container_volumes(container), None)
+
+    def test_config_hash(self):
+        self.mock_client.containers.return_value = []
+        service = Service('foo', client=self.mock_client, image='busybox', environment={'A': '1'})
+        config_hash = service.config_hash()
+        self.assertEqual(service.config_hash(), config_hash)
+        self.assertNotEqual(service.config_hash({'command': 'top'}), config_hash)
+
+        service.options['environment']['A'] = '2'
+        self.assertNotEqual(service.config_hash(), config_hash)
+
+    def test_config_hash_includes_link_aliases(self):
+        self.mock_client.containers.return_value = [
+            {'Id': 'a', 'Image': 'busybox', 'Names': ['/default_db_1'], 'Status': 'Up 1 second'},
+        ]
+        db = Service('db', client=self.mock_client, image='busybox')
+        service = Service('foo', client=self.mock_client, image='busybox', links=[(db, 'database')])
+        config_hash = service.config_hash()
+
+        service.links = [(db, 'other')]
+        self.assertNotEqual(service.config_hash(), config_hash)
+
+    @mock.patch.object(Container, 'create')
+    def test_create_container_stores_config_hash(self, mock_create):
+        self.mock_client.containers.return_value = []
+        service = Service('foo', client=self.mock_client, image='busybox')
+        service.create_container()
+        self.assertEqual(
+            mock_create.call_args[1]['environment']['FIG_CONFIG_HASH'],
+            service.config_hash())
+
+    def test_recreate_containers_skips_up_to_date_containers(self):
+        self.mock_client.containers.return_value = [
+            {'Id': 'a', 'Image': 'busybox', 'Names': ['/default_foo_1'], 'Status': 'Up 1 second'},
+            {'Id': 'b', 'Image': 'busybox', 'Names': ['/default_foo_2'], 'Status': 'Up 1 second'},
+        ]
+        self.mock_client.inspect_image.return_value = {'Id': 'image-id'}
+        service = Service('foo', client=self.mock_client, image='busybox')
+        config_hash = service.config_hash()
+        self.mock_client.inspect_container.side_effect = lambda id: {
+            'Id': id,
+            'Name': '/default_foo_1' if id == 'a' else '/default_foo_2',
+            'Image': 'image-id',
+            'State': {'Running': True},
+            'Config': {'Env': ['FIG_CONFIG_HASH=%s' % (config_hash if id == 'a' else 'old')]},
+        }
+
+        with mock.patch.object(service, 'recreate_container') as mock_recreate:
+            mock_recreate.return_value = (None, mock.sentinel.new_container)
+            tuples = service.recreate_containers()
+
+        self.assertEqual(len(tuples), 2)
+        self.assertEqual(tuples[0][1].id, 'a')
+        self.assertEqual(tuples[1][1], mock.sentinel.new_container)
+        self.assertEqual(mock_recreate.call_args[0][0].id, 'b')
+        self.assertFalse(self.mock_client.start.called)
+
+        with mock.patch.object(service, 'recreate_container') as mock_recreate:
+            service.recreate_containers(force=True)
+        self.assertEqual(mock_recreate.call_count, 2)
+
+    @mock.patch('fig.service.Container', autospec=True)
+    def test_create_container_name_conflict(self, mock_container_class):
+        self.mock_client.containers.return_value = []
+        mock_response = mock.Mock(Response)
+        mock_response.status_code = 409
+        mock_response.reason = "Conflict"
+        mock_container_class.create.side_effect = [
+            APIError('Mock error', mock_response, "Conflict, The name is already assigned"),
+            mock.sentinel.container,
+        ]
+        service = Service('foo', client=self.mock_client, image='busybox')
+
+        self.assertEqual(service.create_container(), mock.sentinel.container)
+        self.assertEqual(
+            [call[1]['name'] for call in mock_container_class.create.call_args_list],
+            ['default_foo_1', 'default_foo_2'])
+
     def test_parse_repository_tag(self):
         self.assertEqual(parse_repository_tag("root"), ("root", ""))
         self.assertEqual(parse_repository_tag("root:tag"), ("root", "tag"))
@@ -219,6 +537,89 @@ class ServiceTest(unittest.TestCase):
         self.assertEqual(Container.create.call_args[1]['image'], 'someimage:latest')
 
 
+class NumberAllocatorTest(unittest.TestCase):
+
+    def test_allocate(self):
+        allocator = NumberAllocator([1, 3])
+        self.assertEqual(allocator.peek(), 4)
+        self.assertEqual(allocator.allocate(), 4)
+        self.assertEqual(allocator.allocate(), 5)
+
+    def test_allocate_empty(self):
+        self.assertEqual(NumberAllocator().allocate(), 1)
+
+    def test_release(self):
+        allocator = NumberAllocator([1, 2])
+        allocator.release(2)
+        self.assertEqual(allocator.allocate(), 2)
+        allocator.release(1)
+        self.assertEqual(allocator.allocate(), 3)
+
+
+class ContainerIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.containers = [
+            {'Id': 'a', 'Names': ['/figtest_web_1']},
+            {'Id': 'b', 'Names': ['/figtest_web_2', '/figtest_lb_1/web']},
+            {'Id': 'c', 'Names': ['/figtest_web_run_1']},
+            {'Id': 'd', 'Names': ['/figtest_db_1']},
+            {'Id': 'e', 'Names': ['/stranger']},
+            {'Id': 'f', 'Names': []},
+        ]
+        self.index = ContainerIndex(self.containers)
+
+    def test_find(self):
+        self.assertEqual(
+            [c['Id'] for c in self.index.find('figtest', 'web')],
+            ['a', 'b'])
+        self.assertEqual(
+            [c['Id'] for c in self.index.find('figtest', 'web', one_off=True)],
+            ['c'])
+        self.assertEqual(self.index.find('figtest', 'cache'), [])
+        self.assertEqual(self.index.find('other', 'web'), [])
+
+    def test_get(self):
+        self.assertEqual(
+            self.index.get(ServiceName('figtest', 'web', 2))['Id'],
+            'b')
+        self.assertEqual(
+            self.index.get(ServiceName('figtest', 'web', 1), one_off=True)['Id'],
+            'c')
+        self.assertEqual(self.index.get(ServiceName('figtest', 'web', 3)), None)
+
+
+class ServiceBuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(self.path, 'Dockerfile'), 'w') as f:
+            f.write('FROM busybox\n')
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.inspect_image.side_effect = lambda image: {'Id': 'f' * 64}
+        self.mock_client.build.return_value = iter([
+            json.dumps({'stream': 'Successfully built abc123\n'}),
+        ])
+        self.service = Service(
+            'web', client=self.mock_client, project='figtest',
+            build=self.path, build_cache=BuildCache(self.path))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_build_tags_services_sharing_the_build_directory(self):
+        worker = Service(
+            'worker', client=self.mock_client, project='figtest',
+            build=self.path, build_cache=self.service.build_cache)
+        with mock.patch('sys.stdout'):
+            self.service.build(shared_with=[worker])
+        self.assertEqual(self.mock_client.build.call_count, 1)
+        self.mock_client.tag.assert_called_once_with('abc123', 'figtest_worker', force=True)
+
+        self.assertEqual(worker.build(), 'abc123')
+        self.assertEqual(self.mock_client.build.call_count, 1)
+
+
 class ServiceVolumesTest(unittest.TestCase):
 
     def test_parse_volume_spec_only_one_path(self):
@@ -0,0 +1,160 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from .. import unittest
+
+import mock
+import docker
+
+from fig.snapshot import ContainerSnapshot, is_running
+
+
+class ContainerSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.containers.return_value = [
+            {'Id': 'abc', 'Names': ['/figtest_web_1'], 'Status': 'Up 3 seconds'},
+            {'Id': 'def', 'Names': ['/figtest_db_1'], 'Status': 'Exited (0) 3 seconds ago'},
+        ]
+        self.mock_client.version.return_value = {'ApiVersion': '1.14'}
+        self.snapshot = ContainerSnapshot(self.mock_client)
+
+    def ids(self, **kwargs):
+        return [c['Id'] for c in self.snapshot.containers(**kwargs)]
+
+    def test_lists_once(self):
+        self.assertEqual(self.ids(), ['abc'])
+        self.assertEqual(self.ids(all=True), ['abc', 'def'])
+        self.mock_client.containers.assert_called_once_with(all=True, trunc=False)
+
+    def test_lists_images_once(self):
+        self.mock_client.images.return_value = [
+            {'Id': 'a' * 64, 'RepoTags': ['busybox:latest', 'busybox:1']},
+            {'Id': 'b' * 64, 'RepoTags': ['<none>:<none>']},
+        ]
+        catalogue = self.snapshot.image_catalogue()
+        self.assertIn('busybox', catalogue)
+        self.assertIn('busybox:1', catalogue)
+        self.assertNotIn('busybox:2', catalogue)
+        self.assertIs(self.snapshot.image_catalogue(), catalogue)
+        self.mock_client.images.assert_called_once_with()
+
+    def test_other_arguments_are_passed_through(self):
+        self.snapshot.containers(quiet=True)
+        self.snapshot.containers(quiet=True)
+        self.assertEqual(self.mock_client.containers.call_count, 2)
+
+    def test_other_calls_are_passed_through(self):
+        self.snapshot.inspect_container('abc')
+        self.mock_client.inspect_container.assert_called_once_with('abc')
+
+    def test_create(self):
+        self.snapshot.containers()
+        self.mock_client.create_container.return_value = {'Id': 'ghi'}
+        self.snapshot.create_container(image='busybox', name='figtest_web_2')
+
+        self.assertEqual(self.ids(), ['abc'])
+        self.assertEqual(self.ids(all=True), ['ghi', 'abc', 'def'])
+        self.assertEqual(
+            self.snapshot.containers(all=True)[0]['Names'],
+            ['/figtest_web_2'])
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+
+    def test_start_stop(self):
+        self.snapshot.containers()
+        self.snapshot.start('def')
+        self.assertEqual(self.ids(), ['abc', 'def'])
+
+        self.snapshot.stop('abc', timeout=1)
+        self.mock_client.stop.assert_called_once_with('abc', timeout=1)
+        self.assertEqual(self.ids(), ['def'])
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+
+    def test_kill(self):
+        self.snapshot.containers()
+        self.snapshot.kill('abc', signal='SIGKILL')
+        self.assertEqual(self.ids(), [])
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+
+    def test_kill_with_other_signal_invalidates(self):
+        self.snapshot.containers()
+        self.snapshot.kill('abc', signal='SIGHUP')
+        self.assertEqual(self.ids(), ['abc'])
+        self.assertEqual(self.mock_client.containers.call_count, 2)
+
+    def test_wait(self):
+        self.snapshot.containers()
+        self.mock_client.wait.return_value = 3
+        self.assertEqual(self.snapshot.wait('abc'), 3)
+        self.assertEqual(self.ids(), [])
+        self.assertEqual(
+            self.snapshot.containers(all=True)[0]['Status'],
+            'Exited (3) Less than a second ago')
+
+    def test_remove(self):
+        self.snapshot.containers()
+        self.snapshot.remove_container({'Id': 'def'}, v=True)
+        self.mock_client.remove_container.assert_called_once_with({'Id': 'def'}, v=True)
+        self.assertEqual(self.ids(all=True), ['abc'])
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+
+    def test_unknown_container_invalidates(self):
+        self.snapshot.containers()
+        self.snapshot.start('figtest_web_1')
+        self.snapshot.containers()
+        self.assertEqual(self.mock_client.containers.call_count, 2)
+
+    def test_container_index_is_kept_until_a_change(self):
+        index = self.snapshot.container_index(stopped=True)
+        self.assertIs(self.snapshot.container_index(stopped=True), index)
+        self.assertEqual(
+            [c['Id'] for c in self.snapshot.container_index().find('figtest', 'db')],
+            [])
+
+        self.snapshot.start('def')
+        self.assertIsNot(self.snapshot.container_index(stopped=True), index)
+        self.assertEqual(
+            [c['Id'] for c in self.snapshot.container_index().find('figtest', 'db')],
+            ['def'])
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+
+    def test_container_index_without_name_filter(self):
+        self.snapshot.container_index(project='figtest', stopped=True)
+        self.mock_client.containers.assert_called_once_with(all=True, trunc=False)
+
+    def test_container_index_with_name_filter(self):
+        self.mock_client.version.return_value = {'ApiVersion': '1.21'}
+        self.mock_client.containers.return_value = [
+            {'Id': 'abc', 'Names': ['/figtest_web_1'], 'Status': 'Up 3 seconds'},
+        ]
+        index = self.snapshot.container_index(project='figtest', stopped=True)
+        self.assertEqual([c['Id'] for c in index.find('figtest', 'web')], ['abc'])
+        self.snapshot.container_index(project='figtest')
+        self.mock_client.containers.assert_called_once_with(
+            all=True, trunc=False, filters={'name': 'figtest_'})
+        self.mock_client.version.assert_called_once_with()
+
+    def test_create_only_adds_to_matching_listings(self):
+        self.mock_client.version.return_value = {'ApiVersion': '1.21'}
+        self.mock_client.containers.return_value = []
+        self.snapshot.container_index(project='figtest', stopped=True)
+
+        self.mock_client.create_container.return_value = {'Id': 'ghi'}
+        self.snapshot.create_container(image='busybox', name='figtest_web_1')
+        self.mock_client.create_container.return_value = {'Id': 'jkl'}
+        self.snapshot.create_container(image='busybox')
+        self.snapshot.start('jkl')
+
+        index = self.snapshot.container_index(project='figtest', stopped=True)
+        self.assertEqual([c['Id'] for c in index.find('figtest', 'web')], ['ghi'])
+        self.assertEqual(
+            [c['Id'] for c in self.snapshot.containers(all=True, filters={'name': 'figtest_'})],
+            ['ghi'])
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+
+    def test_is_running(self):
+        self.assertTrue(is_running({'Status': 'Up 2 hours (Paused)'}))
+        self.assertTrue(is_running({'Status': 'Restarting (1) 2 seconds ago'}))
+        self.assertFalse(is_running({'Status': 'Exited (0) 3 seconds ago'}))
+        self.assertFalse(is_running({'Status': ''}))
+        self.assertFalse(is_running({}))